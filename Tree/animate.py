@@ -0,0 +1,117 @@
+"""
+Module for drawing the growth of trees as animations, frame by frame.
+"""
+from PIL import Image
+import svgwrite
+
+from Tree.draw import SvgDrawer
+from Tree.utils import convert_color, unite_rectangles
+
+def fit_frames(tree, times):
+    """Move the tree, so that it stays inside the frames while growing.
+
+    The frames cover the tree and the circle around the end of its first branch,
+    in which all branches grown later lie. With sigma, the branches may become longer.
+
+    Args:
+        tree (object): The tree, which should be animated.
+        times (int): How many times the tree will grow.
+
+    Returns:
+        tupel: The size of the frames. (width, height)
+    """
+    scale = max(branch[0] for branch in tree.branches)
+    radius = tree.length * sum(pow(scale, i) for i in range(1, tree.age+times+1))
+    x, y = next(tree.iter_age_nodes(0))
+    rec = unite_rectangles([tree.get_rectangle(), (x-radius, y-radius, x+radius, y+radius)])
+    tree.move((-rec[0], -rec[1]))
+    return (int(rec[2]-rec[0])+1, int(rec[3]-rec[1])+1)
+
+def iter_frames(tree, canvas, times, stem_color, leaf_color, thickness, **kwargs):
+    """Grow a tree generation by generation and draw only the new age onto the canvas.
+
+    The first frame is the tree as it is. After every generation the age before is
+    drawn again in its stem color and the new age in the leaf color, so every frame
+    looks like the whole tree drawn at once. The stem gradient is spread over the
+    final age, so the ages keep their color in all frames.
+
+    Args:
+        tree (object): The tree, which should be animated.
+        canvas (object): The canvas, which holds the frame after every step.
+        times (int): How many times the tree will grow.
+        stem_color (tupel): Color or gradient for the stem of the tree.
+        leaf_color (tupel): Color for the leaf (= the color for last iteration).
+        thickness (int): The start thickness of the tree.
+        **kwargs: Further options for the drawer.
+
+    Yields:
+        int: The age of the tree drawn on the canvas.
+    """
+    gradient_age = tree.age+times
+    tree.draw_on(canvas, stem_color, leaf_color, thickness, gradient_age=gradient_age, **kwargs)
+    yield tree.age
+    for age in tree.iter_grow(times):
+        tree.draw_on(canvas, stem_color, leaf_color, thickness, [age-1, age], gradient_age=gradient_age, **kwargs)
+        yield age
+
+def save_frames(tree, path, times, stem_color, leaf_color, thickness, background=(0, 0, 0), duration=200, **kwargs):
+    """Save the growth of a tree as numbered images or as animated image.
+
+    Numbered images are saved one by one. For animated images (e.g. gif or webp)
+    the frames are handed to PIL, which may keep them in the memory.
+
+    Args:
+        tree (object): The tree, which should be animated.
+        path (string): The path of the animation, or of the images containing {frame}. e.g. tree_{frame}.png
+        times (int): How many times the tree will grow.
+        background (tupel): The color of the frames.
+        duration (int): The time every frame is shown in milliseconds.
+
+    Returns:
+        list: The paths of the saved images.
+    """
+    canvas = Image.new("RGB", fit_frames(tree, times), background)
+    frames = iter_frames(tree, canvas, times, stem_color, leaf_color, thickness, **kwargs)
+
+    if "{frame}" in path:
+        paths = []
+        for frame, _ in enumerate(frames):
+            paths.append(path.format(frame=frame))
+            canvas.save(paths[-1])
+        return paths
+
+    images = (canvas.copy() for _ in frames)
+    next(images).save(path, save_all=True, append_images=images, duration=duration, loop=0)
+    return [path]
+
+def save_svg_animation(tree, path, times, stem_color, leaf_color, thickness, duration=200, **kwargs):
+    """Save the growth of a tree as a single animated svg document.
+
+    Every new age is appended as hidden group, which is shown in its frame by a
+    set element. Then the age before changes from the leaf to its stem color.
+
+    Args:
+        tree (object): The tree, which should be animated.
+        path (string): The path of the svg document.
+        times (int): How many times the tree will grow.
+        duration (int): The time every frame is shown in milliseconds.
+    """
+    drawing = svgwrite.Drawing(path, size=fit_frames(tree, times))
+    options = dict(kwargs, gradient_age=tree.age+times)
+    drawer = SvgDrawer(tree, drawing, stem_color, leaf_color, thickness, **options)
+    drawer.draw()
+    groups = dict(drawer.group)
+
+    for frame, age in enumerate(tree.iter_grow(times), 1):
+        begin = "{}ms".format(frame*duration)
+        drawer = SvgDrawer(tree, drawing, stem_color, leaf_color, thickness, [age], **options)
+        drawer.draw()
+        if age in drawer.group:
+            drawer.group[age]["visibility"] = "hidden"
+            drawer.group[age].add(drawing.set(attributeName="visibility", to="visible", begin=begin, fill="freeze"))
+        if age-1 in groups:
+            stem = convert_color(drawer._get_color(age-1))
+            groups[age-1].add(drawing.set(attributeName="stroke", to=stem, begin=begin, fill="freeze"))
+        groups.update(drawer.group)
+
+    drawing.save()
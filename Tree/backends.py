@@ -0,0 +1,80 @@
+"""
+Module for finding the drawer of a canvas.
+
+Drawers are registered by the module of their canvas class and are imported,
+when the first canvas of this module is drawn on. Other packages can add drawers
+with a entry point in the group tree.drawers, named by the module of the canvas:
+
+    entry_points={"tree.drawers": ["mylib.canvas = mypackage.drawer:MyDrawer"]}
+"""
+from importlib import import_module
+
+ENTRY_POINT_GROUP = "tree.drawers"
+
+# The drawer for the canvases of every module, as class or as "module:class"
+DRAWERS = {
+    "PIL.Image": "Tree.draw:PilDrawer",
+    "svgwrite.drawing": "Tree.draw:SvgDrawer",
+    "Tree.raster": "Tree.raster:NumpyDrawer"
+}
+
+_entry_points_loaded = False
+
+class UnsupportedCanvasError(TypeError):
+    """Raised, if there is no drawer for a canvas."""
+    pass
+
+def register_drawer(module, drawer):
+    """Register a drawer for the canvases of a module.
+
+    Args:
+        module (string): The module of the canvas class, e.g. PIL.Image.
+        drawer (object): The drawer class or its path as "module:class", imported when first used.
+    """
+    DRAWERS[module] = drawer
+
+def get_drawer(canvas):
+    """Get the drawer for a canvas.
+
+    The drawer is looked up by the module of the canvas class and of its base classes.
+
+    Args:
+        canvas (object): The canvas, e.g. a PIL.Image or a svgwrite.Drawing.
+
+    Returns:
+        class: The drawer class.
+
+    Raises:
+        UnsupportedCanvasError: If there is no drawer for the canvas.
+    """
+    _load_entry_points()
+    for cls in type(canvas).__mro__:
+        drawer = DRAWERS.get(cls.__module__)
+        if drawer is None:
+            continue
+        if isinstance(drawer, str):
+            module, name = drawer.split(":")
+            drawer = DRAWERS[cls.__module__] = getattr(import_module(module), name)
+        return drawer
+
+    raise UnsupportedCanvasError("There is no drawer for {}.{}. Supported are canvases of: {}".format(
+        type(canvas).__module__, type(canvas).__name__, ", ".join(sorted(DRAWERS))))
+
+def _load_entry_points():
+    """Register the drawers of other packages once, without importing them."""
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    points = entry_points()
+    if hasattr(points, "select"):
+        points = points.select(group=ENTRY_POINT_GROUP)
+    else:
+        points = points.get(ENTRY_POINT_GROUP, [])
+    for point in points:
+        DRAWERS.setdefault(point.name, point.value)
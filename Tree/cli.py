@@ -1,3 +1,8 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from math import radians
 
 import click
@@ -5,7 +10,15 @@ import click
 from PIL import Image
 import svgwrite
 
-from Tree.core import Tree
+from Tree.animate import save_frames, save_svg_animation
+from Tree.core import Tree, BudgetError
+from Tree.draw import SvgStreamDrawer
+from Tree.server import MAX_BYTES, RenderServer
+from Tree.storage import dump_tree, load_tree
+from Tree.tile import save_png, save_tiles
+
+# Height of the strips, in which streamed png files are drawn
+STRIP_HEIGHT = 256
 
 def get_format(path):
     pos = path.find(".")
@@ -14,49 +27,289 @@ def get_format(path):
         return False
     return path[pos+1:]
 
-@click.command()
-@click.option("--length", "-l", help="The start length of tree.", type=float, default=300)
-@click.option("--branches", "-b", help="Add a branch with a scale and a angle.", multiple=True, type=(float, int), default=[[.5, 45], [.5, -45]])
-@click.option("--sigma", "-s", help="Add randomness to scale and angle.", nargs=2, type=float, default=(0, 0))
-@click.option("--age", "-a", help="Indicates how many time the tree should be iterated.",type=int, default=5)
-@click.option("--path", "-p", help="The path for saving the tree. Multiple formats supported e.g. svg.", default=None)
-@click.option("--show", help="Shows a image of the tree.", is_flag=True)
-@click.option("--stem_color1", "-sc1", help="The stem start color given as r g b", nargs=3, type=int, default=(255, 0, 255))
-@click.option("--stem_color2", "-sc2", help="The stem end color given as r g b", nargs=3, type=int, default=(255, 0, 255))
-@click.option("--leaf_color", "-lc", help="The leaf color given as r g b", nargs=3, type=int, default=(255, 255, 255))
-@click.option("--thickness", "-t", help="The start width of the first branch.", type=int, default=5)
+def render_tree(length=300, branches=((.5, 45), (.5, -45)), sigma=(0, 0), age=5, path=None, show=False, stream=False,
+                stem_color=(255, 0, 255), leaf_color=(255, 255, 255), thickness=5, max_nodes=None, max_bytes=None,
+                seed=None, tile=None, lod=None, profile=False, dump=None, load=None, instances=False,
+                animate=False, frame_duration=200, antialias=False):
+    """Grow a tree and save and/or show it.
 
-def create_tree(length, branches, sigma, age, path, show, stem_color1, stem_color2, leaf_color, thickness):
-    stem_color = stem_color1+stem_color2
+    Args:
+        length (float): The start length of tree.
+        branches (tupel/array): Holding a scale and a angle in degrees for every branch.
+        sigma (tupel): Holding the branch and angle sigma.
+        age (int): Indicates how many time the tree should be iterated.
+        path (string): The path for saving the tree. Multiple formats supported e.g. svg.
+        show (bool): Shows a image of the tree.
+        stream (bool): Writes svg files directly, one path per age, and png files strip by strip.
+        stem_color (tupel): Color or gradient for the stem of the tree.
+        leaf_color (tupel): Color for the leaf.
+        thickness (int): The start width of the first branch.
+        max_nodes (int): The maximum number of nodes the tree may have.
+        max_bytes (int): The maximum number of bytes the tree and the image may need.
+        seed (int): Seed for the randomness given by sigma.
+        tile (tupel): If given, images are saved as tiles of this size. (width, height)
+        lod (float): If given, branches shorter than this many pixels are replaced by leaf color.
+        profile (bool): Prints the time of every phase and the counters as json.
+        dump (string): If given, the grown tree is saved at this path.
+        load (string): If given, the tree saved at this path is drawn as saved, instead of growing one.
+        instances (bool): Computes the nodes of a tree without sigma when they are read instead
+            of keeping them, and draws svg files with copies of the branches of every age.
+        animate (bool): Saves the growth as animation: svg, gif or webp, or as numbered images,
+            if the path contains {frame}.
+        frame_duration (int): The time every frame of a animation is shown in milliseconds.
+        antialias (bool): Draws images by numpy, with the edges covering the pixels partly.
+
+    Returns:
+        object: The Stats of the tree, with the time of every phase and the written bytes.
+    """
     options = [
-        stem_color,
-        leaf_color,
+        tuple(stem_color),
+        tuple(leaf_color),
         thickness
     ]
-    
+    draw_options = {} if lod is None else {"min_length": lod, "leaf_fill": True}
+
     #Convert angles to radians
     branches = [[branch[0], radians(branch[1])] for branch in branches]
 
-    tree = Tree((0, 0, 0, -length), branches, sigma)
-    tree.grow(times=age)
-    tree.move_in_rectangle()
+    if load is not None:
+        tree = load_tree(load)
+        age = tree.age
+    else:
+        if instances and tuple(sigma) != (0, 0):
+            raise click.ClickException("Only trees without sigma can be drawn with instances.")
+        tree = Tree((0, 0, 0, -length), branches, sigma, max_nodes=max_nodes, max_bytes=max_bytes, seed=seed,
+                    instanced=instances)
+    stats = tree.stats
 
     form = get_format(path) if path is not None else None
+    raster = form not in ("svg", None)
+    tiled = raster and (tile is not None or (stream and form == "png"))
+
+    # Check the budget before anything is allocated
+    costs = tree.estimate(age)
+    needed = costs["node_bytes"]
+    if show or (raster and not tiled):
+        # The numpy canvas has a alpha channel and a byte of coverage for every pixel
+        needed += costs["raster_bytes"] * 5 // 3 if antialias else costs["raster_bytes"]
+    if form == "svg":
+        needed += costs["svg_bytes"]
+    if max_bytes is not None and needed > max_bytes:
+        raise click.ClickException("The tree needs about {} bytes, but only {} are allowed.".format(needed, max_bytes))
 
-    if show or form not in ("svg", None):
+    if animate:
+        if not form:
+            raise click.ClickException("A animation needs a path with a format, e.g. tree.gif.")
+        try:
+            with stats.timer("save"):
+                if form == "svg":
+                    save_svg_animation(tree, path, age-tree.age, *options, duration=frame_duration,
+                                       instances=instances, **draw_options)
+                    paths = [path]
+                else:
+                    paths = save_frames(tree, path, age-tree.age, *options, duration=frame_duration, **draw_options)
+        except BudgetError as error:
+            raise click.ClickException(str(error))
+        if dump is not None:
+            dump_tree(tree, dump)
+        return report_stats(stats, paths, profile)
+
+    if load is None:
+        try:
+            tree.grow(times=age)
+        except BudgetError as error:
+            raise click.ClickException(str(error))
+    tree.move_in_rectangle()
+
+    if dump is not None:
+        with stats.timer("dump"):
+            dump_tree(tree, dump)
+
+    if (show or (raster and not tiled)) and antialias:
+        from Tree.raster import NumpyCanvas
+        canvas = NumpyCanvas(tree.get_size())
+        tree.draw_on(canvas, *options, **draw_options)
+        im = canvas.to_image("RGB")
+    elif show or (raster and not tiled):
         im = Image.new("RGB", tree.get_size())
-        tree.draw_on(im, *options)
+        tree.draw_on(im, *options, **draw_options)
 
-    if form == "svg":
+    paths = [path] if form is not None else []
+    if form == "svg" and stream:
+        with stats.timer("save"), open(path, "w") as svg:
+            SvgStreamDrawer(tree, svg, *options, **draw_options).draw()
+    elif form == "svg":
         svg = svgwrite.Drawing(path)
-        tree.draw_on(svg, *options)
-        svg.save()
+        tree.draw_on(svg, *options, instances=instances and tuple(tree.sigma) == (0, 0), **draw_options)
+        with stats.timer("save"):
+            svg.save()
 
-    if form not in ("svg", None):
-        im.save(path)
+    if raster and tile is not None:
+        root, ext = os.path.splitext(path)
+        root = root.replace("{", "{{").replace("}", "}}")
+        with stats.timer("save"):
+            paths = save_tiles(tree, root + "_{row}_{column}" + ext, tree.get_size(), tile, *options, **draw_options)
+    elif tiled:
+        with stats.timer("save"):
+            save_png(tree, path, tree.get_size(), STRIP_HEIGHT, *options, **draw_options)
+    elif raster:
+        with stats.timer("save"):
+            im.save(path)
 
     if show:
         im.show()
 
+    return report_stats(stats, paths, profile)
+
+def report_stats(stats, paths, profile):
+    """Count the bytes of the saved files and print the stats.
+
+    Args:
+        stats (object): The Stats of the tree.
+        paths (list): The paths of the saved files.
+        profile (bool): Prints the stats as json.
+
+    Returns:
+        object: The Stats.
+    """
+    for saved in paths:
+        stats.count("bytes", os.path.getsize(saved))
+
+    if profile:
+        click.echo(json.dumps(stats.as_dict(), indent=2, sort_keys=True))
+    return stats
+
+def render_job(job):
+    """Render a tree of a batch in a worker process.
+
+    Args:
+        job (dict): The arguments for render_tree.
+
+    Returns:
+        tupel: The path, the duration in seconds and the error message or None.
+    """
+    start = time.perf_counter()
+    try:
+        render_tree(**job)
+    except Exception as error:
+        return job.get("path"), time.perf_counter()-start, str(error) or repr(error)
+    return job.get("path"), time.perf_counter()-start, None
+
+def tree_options(func):
+    """Add the options describing a tree and its output to a command."""
+    options = [
+        click.option("--length", "-l", help="The start length of tree.", type=float, default=300),
+        click.option("--branches", "-b", help="Add a branch with a scale and a angle.", multiple=True, type=(float, int), default=[[.5, 45], [.5, -45]]),
+        click.option("--sigma", "-s", help="Add randomness to scale and angle.", nargs=2, type=float, default=(0, 0)),
+        click.option("--age", "-a", help="Indicates how many time the tree should be iterated.",type=int, default=5),
+        click.option("--path", "-p", help="The path for saving the tree. Multiple formats supported e.g. svg.", default=None),
+        click.option("--stream", help="Writes svg files directly, one path per age, and png files strip by strip.", is_flag=True),
+        click.option("--tile", help="Saves images as tiles of this size, given as width height.", nargs=2, type=int, default=None),
+        click.option("--stem_color1", "-sc1", help="The stem start color given as r g b", nargs=3, type=int, default=(255, 0, 255)),
+        click.option("--stem_color2", "-sc2", help="The stem end color given as r g b", nargs=3, type=int, default=(255, 0, 255)),
+        click.option("--leaf_color", "-lc", help="The leaf color given as r g b", nargs=3, type=int, default=(255, 255, 255)),
+        click.option("--thickness", "-t", help="The start width of the first branch.", type=int, default=5),
+        click.option("--max_nodes", help="The maximum number of nodes the tree may have.", type=int, default=None),
+        click.option("--max_bytes", help="The maximum number of bytes the tree and the image may need.", type=int, default=None),
+        click.option("--seed", help="The seed for the randomness given by sigma.", type=int, default=None),
+        click.option("--lod", help="Replaces branches shorter than this many pixels by leaf color.", type=float, default=None),
+        click.option("--dump", help="Saves the grown tree at this path, for drawing it again with --load.", default=None),
+        click.option("--load", help="Draws the tree saved at this path instead of growing one, ignoring the tree options.", type=click.Path(exists=True), default=None),
+        click.option("--instances", help="Computes the nodes of a tree without sigma when they are read instead of keeping them, and draws svg files with copies of every age.", is_flag=True),
+        click.option("--animate", help="Saves the growth as svg, gif or webp animation, or as numbered images, if the path contains {frame}.", is_flag=True),
+        click.option("--frame_duration", help="The time every frame of a animation is shown in milliseconds.", type=int, default=200),
+        click.option("--antialias", help="Draws images by numpy, with the edges covering the pixels partly.", is_flag=True)
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+@click.command()
+@tree_options
+@click.option("--show", help="Shows a image of the tree.", is_flag=True)
+@click.option("--profile", help="Prints the time of every phase and the drawn segments and written bytes as json.", is_flag=True)
+
+def create_tree(length, branches, sigma, age, path, show, profile, stream, tile, stem_color1, stem_color2, leaf_color, thickness, max_nodes, max_bytes, seed, lod, dump, load, instances, animate, frame_duration, antialias):
+    render_tree(length, branches, sigma, age, path, show, stream, stem_color1+stem_color2, leaf_color, thickness,
+                max_nodes, max_bytes, seed, tile, lod, profile, dump, load, instances, animate, frame_duration, antialias)
+
+@click.command()
+@click.argument("manifest", type=click.File(), required=False)
+@click.option("--workers", "-w", help="The number of worker processes. Defaults to the number of cpus.", type=int, default=None)
+@click.option("--count", "-n", help="Without manifest: the number of variants, rendered with consecutive seeds. For more than one, the path must contain {seed}.", type=int, default=1)
+@tree_options
+
+def create_trees(manifest, workers, count, length, branches, sigma, age, path, stream, tile, stem_color1, stem_color2, leaf_color, thickness, max_nodes, max_bytes, seed, lod, dump, load, instances, animate, frame_duration, antialias):
+    """Render many trees in parallel.
+
+    The trees are read from MANIFEST, a file with one json object of render
+    options per line (e.g. {"age": 8, "sigma": [0.1, 0.1], "seed": 3, "path": "tree3.png"}).
+    Without MANIFEST, the tree given by the options is rendered for several seeds,
+    starting at --seed.
+    """
+    if manifest is not None:
+        jobs = [json.loads(line) for line in manifest if line.strip()]
+    else:
+        if path is None:
+            raise click.UsageError("Either a manifest or a path is needed.")
+        if count > 1 and "{seed}" not in path:
+            raise click.UsageError("The path needs {seed} for more than one variant, e.g. tree_{seed}.png.")
+        if count > 1 and dump is not None and "{seed}" not in dump:
+            raise click.UsageError("The dump path needs {seed} for more than one variant, e.g. tree_{seed}.tree.")
+        first = seed or 0
+        jobs = [{
+            "length": length,
+            "branches": branches,
+            "sigma": sigma,
+            "age": age,
+            "path": path.format(seed=n),
+            "stream": stream,
+            "tile": tile,
+            "stem_color": stem_color1+stem_color2,
+            "leaf_color": leaf_color,
+            "thickness": thickness,
+            "max_nodes": max_nodes,
+            "max_bytes": max_bytes,
+            "seed": n,
+            "lod": lod,
+            "dump": None if dump is None else dump.format(seed=n),
+            "load": load,
+            "instances": instances,
+            "animate": animate,
+            "frame_duration": frame_duration,
+            "antialias": antialias
+        } for n in range(first, first+count)]
+
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for job_path, duration, error in pool.map(render_job, jobs):
+            if error is None:
+                click.echo("{}: {:.3f}s".format(job_path, duration))
+            else:
+                failed += 1
+                click.echo("{}: failed after {:.3f}s: {}".format(job_path, duration, error), err=True)
+    click.echo("{} trees in {:.3f}s".format(len(jobs), time.perf_counter()-start))
+
+    if failed:
+        raise click.ClickException("{} of {} trees failed.".format(failed, len(jobs)))
+
+@click.command()
+@click.option("--host", help="The host to listen on.", default="127.0.0.1")
+@click.option("--port", help="The port to listen on.", type=int, default=8080)
+@click.option("--unix", help="Listens on a unix socket at this path instead.", default=None)
+@click.option("--workers", "-w", help="The number of worker processes. Defaults to the number of cpus.", type=int, default=None)
+@click.option("--cache_size", help="The number of rendered images kept in the cache.", type=int, default=64)
+@click.option("--max_nodes", help="The maximum number of nodes a tree may have.", type=int, default=None)
+@click.option("--max_bytes", help="The maximum number of bytes a tree and its image may need.", type=int, default=MAX_BYTES, show_default=True)
+
+def serve_trees(host, port, unix, workers, cache_size, max_nodes, max_bytes):
+    """Render trees on request, e.g. GET /render?age=8&branch=0.5,45&branch=0.5,-45&format=svg"""
+    server = RenderServer(workers, cache_size, max_nodes, max_bytes)
+    try:
+        asyncio.run(server.serve(host, port, unix))
+    except KeyboardInterrupt:
+        pass
+
 if __name__ == "__main__":
     create_tree()
@@ -1,49 +1,120 @@
 """
 Module for creating trees
 """
-from math import pi, log, sqrt
-from random import gauss
-from Tree.utils import Node
-from Tree.draw import SUPPORTED_CANVAS
+import os
+from array import array
+from itertools import islice
+from math import atan2, log, pi, sqrt
+from Tree.utils import get_bounds, unite_rectangles
+from Tree.backends import get_drawer
+from Tree.engine import ENGINES
+from Tree.index import GridIndex
+from Tree.instance import Instances, Level
+from Tree.stats import Stats
+
+# Bytes needed for one node: x, y and angle as doubles
+NODE_BYTES = 3*8
+# Bytes of one branch, written as line element by svgwrite
+SVG_BRANCH_BYTES = 100
+# Bytes of one pixel of a RGB image
+PIXEL_BYTES = 3
+# Nodes needed in a age, before grow_parallel splits the tree there by default
+SPLIT_NODES = 64
+
+class BudgetError(Exception):
+    """Raised, if growing a tree would exceed its node or memory budget."""
+    pass
 
 class Tree:
-    """The standard tree."""
-    def __init__(self, pos=(0, 0, 0, -100), branches=None, sigma=(0, 0)):
+    """The standard tree.
+
+    Attributes:
+        nodes (list): Holding a flat array of doubles for every age, with the coordinates
+            of the nodes stored one after another. [x1, y1, x2, y2, ...]
+            The coordinates are stored as grown, the offset is added when reading them.
+            Instanced trees hold a Level view for every age but the first, computing the nodes when read.
+        angles (list): Holding a array for every age with the angle of the branch
+            leading to each node, relative to the horizont.
+        rectangles (list): Holding the rectangle around the nodes of every age, as grown. (x1, y1, x2, y2)
+        offset (tupel): The distance the tree has been moved since it was created. (x, y)
+        indexes (dict): Holding the grid index of every age queried so far.
+        instances (object): The Instances computing the nodes of a instanced tree, else None.
+        stats (object): The timers and counters of the tree, shared with its drawers.
+    """
+    def __init__(self, pos=(0, 0, 0, -100), branches=None, sigma=(0, 0), engine="python",
+                 max_nodes=None, max_bytes=None, seed=None, stats=None, instanced=False):
         """The contructor.
 
         Args:
             pos (tupel): A tupel, holding the start and end point of the tree. (x1, y1, x2, y2)
             branches (tupel/array): Holding array/s with scale and angle for every branch.
             sigma (tuple): Holding the branch and angle sigma. e.g.(0.1, 0.2)
+            engine (string): The engine used for growing. Supported engines: python and numpy
+            max_nodes (int): The maximum number of nodes the tree may grow.
+            max_bytes (int): The maximum number of bytes the nodes of the tree may need.
+            seed (int): The seed for the random generator of the tree, used for sigma.
+                Trees with the same seed grow the same, in every thread or process.
+            stats (object): The Stats collecting timers and counters. A new one by default.
+            instanced (bool): Keeps only the root and the length of the branches of every age,
+                and computes the nodes when they are read. Only for trees without sigma.
+
+        Raises:
+            ValueError: If a tree with sigma should be instanced.
         """
         self.pos = pos
         self.length = sqrt((pos[2]-pos[0])**2+(pos[3]-pos[1])**2)
         self.branches = branches
         self.sigma = sigma
+        self.seed = seed
+        self.engine = ENGINES[engine](self)
+        self.engine.seed(seed)
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.stats = Stats() if stats is None else stats
 
         self.comp = len(self.branches)
         self.age = 0
 
         self.nodes = [
-            [Node(pos[2:])]
+            array("d", pos[2:])
+        ]
+        self.angles = [
+            array("d", [atan2(pos[2]-pos[0], pos[3]-pos[1]) - pi / 2])
         ]
+        self.rectangles = [
+            tuple(pos[2:])*2
+        ]
+        self.offset = (0, 0)
+        self.indexes = {}
+
+        self.instances = None
+        if instanced:
+            if tuple(sigma) != (0, 0):
+                raise ValueError("Only trees without sigma can be instanced.")
+            self.instances = Instances(self)
 
-    def get_rectangle(self):
+    def get_rectangle(self, age=None):
         """Gets the coordinates of the rectangle, in which the tree can be put.
 
+        The rectangles of every age are computed while growing, so no node has to be visited.
+
+        Args:
+            age (int): If given, only the rectangle around the branches of this age.
+
         Returns:
             tupel: (x1, y1, x2, y2)
         """
-        rec = [self.pos[0], self.pos[1]]*2
-        for age in self.nodes:
-            for node in age:
-                # Check max/min for x/y coords
-                for i in range(2):
-                    if rec[0+i] > node.pos[i]:
-                        rec[0+i] = node.pos[i]
-                    elif rec[2+i] < node.pos[i]:
-                        rec[2+i] = node.pos[i]
-        return tuple(rec)
+        root = tuple(self.pos[:2])*2
+        if age is None:
+            rec = unite_rectangles(self.rectangles)
+        elif age == 0:
+            rec = self.rectangles[0]
+        else:
+            rec = unite_rectangles(self.rectangles[age-1:age+1])
+
+        dx, dy = self.offset
+        rec = (rec[0]+dx, rec[1]+dy, rec[2]+dx, rec[3]+dy)
+        return unite_rectangles([rec, root]) if age in (None, 0) else rec
 
     def get_size(self):
         """Get the size of the tree.
@@ -74,9 +145,10 @@ class Tree:
         """Get, how much steps will needed for a given branch length.
 
         Returns:
-            float: The age the tree must achieve to reach the given branch length.
+            float: The age the tree must achieve, until even its longest branches
+                reach the given branch length.
         """
-        return log(length/self.length, min(self.branches[0][0]))
+        return log(length/self.length, max(branch[0] for branch in self.branches))
 
     def get_node_sum(self, age=None):
         """Get sum of all branches in the tree.
@@ -87,7 +159,7 @@ class Tree:
         if age is None:
             age = self.age
 
-        return age if self.comp == 1 else int((pow(self.comp, age+1) - 1) / (self.comp - 1))
+        return age+1 if self.comp == 1 else (pow(self.comp, age+1) - 1) // (self.comp - 1)
 
     def get_node_age_sum(self, age=None):
         """Get the sum of branches grown in an specific age.
@@ -100,6 +172,74 @@ class Tree:
 
         return pow(self.comp, age)
 
+    def estimate(self, age=None):
+        """Estimate the costs of the tree grown until an age, without growing it.
+
+        The size of the raster image is a upper bound, derived from the longest
+        branch of every age. With sigma, the branches may become longer.
+
+        Args:
+            age (int): The age, for which you want to know the costs.
+
+        Returns:
+            dict: Holding the number of nodes and branches and the estimated bytes
+                for the nodes, a RGB image and a svg document.
+        """
+        if age is None:
+            age = self.age
+
+        nodes = self.get_node_sum(age)
+        scale = max(branch[0] for branch in self.branches)
+        radius = self.length * sum(pow(scale, i) for i in range(age+1))
+        width = int(2*radius)+1
+
+        return {
+            "nodes": nodes,
+            "branches": nodes,
+            "node_bytes": nodes * NODE_BYTES,
+            "raster_bytes": width * width * PIXEL_BYTES,
+            "svg_bytes": nodes * SVG_BRANCH_BYTES
+        }
+
+    def check_budget(self, age):
+        """Check, if the tree can grow until an age without exceeding its budget.
+
+        Args:
+            age (int): The age the tree should achieve.
+
+        Raises:
+            BudgetError: If the tree would have too many nodes or need too much memory.
+        """
+        costs = self.estimate(age)
+        if self.max_nodes is not None and costs["nodes"] > self.max_nodes:
+            raise BudgetError("Growing until age {} needs {} nodes, but only {} are allowed.".format(
+                age, costs["nodes"], self.max_nodes))
+        if self.max_bytes is not None and costs["node_bytes"] > self.max_bytes:
+            raise BudgetError("Growing until age {} needs {} bytes, but only {} are allowed.".format(
+                age, costs["node_bytes"], self.max_bytes))
+
+    def get_template(self, age):
+        """Get the children of a node of an age, relative to the node.
+
+        Without sigma, the subtrees below the nodes of an age are the same, only
+        moved to the node and rotated by its angle. So every subtree can be drawn
+        as a copy of the children of one node, each with the copy of its own subtree.
+
+        Args:
+            age (int): The age of the node.
+
+        Returns:
+            list: Holding (x, y, angle) for every child, relative to a node at (0, 0)
+                with the angle 0.
+
+        Raises:
+            ValueError: If the tree has sigma.
+        """
+        if tuple(self.sigma) != (0, 0):
+            raise ValueError("Only trees without sigma have templates.")
+        nodes, angles = self.engine.step(array("d", [0, 0]), array("d", [0]), age)
+        return [(nodes[2*i], nodes[2*i+1], angles[i]) for i in range(self.comp)]
+
     def get_nodes(self):
         """Get the tree nodes as list.
 
@@ -113,12 +253,7 @@ class Tree:
                 ...
                 ]
         """
-        nodes = []
-        for age, level in enumerate(self.nodes):
-            nodes.append([])
-            for node in level:
-                nodes[age].append(node.get_tuple())
-        return nodes
+        return [list(self.iter_age_nodes(age)) for age in range(self.age+1)]
 
     def get_branches(self):
         """Get the tree branches as list.
@@ -133,94 +268,328 @@ class Tree:
                 ...
                 ]
         """
-        branches = []
-        for age, level in enumerate(self.nodes):
-            branches.append([])
-            for n, node in enumerate(level):
-                if age == 0:
-                    p_node = Node(self.pos[:2])
-                else:
-                    p_node = self._get_node_parent(age-1, n)
-                branches[age].append(p_node.get_tuple() + node.get_tuple())
+        with self.stats.timer("get_branches"):
+            return [list(self.iter_age_branches(age)) for age in range(self.age+1)]
+
+    def iter_age_nodes(self, age):
+        """Iterate over the nodes of an age.
+
+        Args:
+            age (int): The age of the nodes.
+
+        Yields:
+            tupel: The coordinates of a node. (x, y)
+        """
+        dx, dy = self.offset
+        coords = iter(self.nodes[age])
+        for x, y in zip(coords, coords):
+            yield (x+dx, y+dy)
+
+    def iter_age_branches(self, age):
+        """Iterate over the branches of an age.
+
+        Args:
+            age (int): The age of the branches.
+
+        Yields:
+            tupel: The coordinates of a branch. (x1, y1, x2, y2)
+        """
+        dx, dy = self.offset
+        if age == 0:
+            return iter([(self.pos[0], self.pos[1], self.nodes[0][0]+dx, self.nodes[0][1]+dy)])
+        return self._iter_age_branches(age, dx, dy)
+
+    def _iter_age_branches(self, age, dx, dy):
+        """Iterate over the branches of an age, moved by a offset."""
+        parents = iter(self.nodes[age-1])
+        coords = iter(self.nodes[age])
+        nodes = zip(coords, coords)
+        for x1, y1 in zip(parents, parents):
+            x1, y1 = x1+dx, y1+dy
+            for x2, y2 in islice(nodes, self.comp):
+                yield (x1, y1, x2+dx, y2+dy)
+
+    def get_index(self, age):
+        """Get the grid index of the branches of an age.
+
+        The index is built on the first call and kept in indexes. It is built from the
+        unmoved coordinates, so it stays valid when the tree is moved.
+
+        Args:
+            age (int): The age of the branches.
+
+        Returns:
+            object: The GridIndex of the age.
+        """
+        if age not in self.indexes:
+            rec = self.rectangles[0] if age == 0 else unite_rectangles(self.rectangles[age-1:age+1])
+            branches = self._iter_age_branches(age, 0, 0) if age > 0 else iter([rec])
+            with self.stats.timer("index"):
+                self.indexes[age] = GridIndex(branches, rec, self.get_node_age_sum(age))
+        return self.indexes[age]
+
+    def query_age(self, age, rectangle):
+        """Iterate over the branches of an age, which cross a rectangle.
 
-        return branches
+        A branch crosses the rectangle, if the rectangle around the branch does.
+        Ages outside the rectangle are skipped at once, else the grid index of the
+        age is used to visit only the branches near the rectangle.
+
+        Args:
+            age (int): The age of the branches.
+            rectangle (tupel): The rectangle. (x1, y1, x2, y2)
+
+        Yields:
+            tupel: The coordinates of a branch. (x1, y1, x2, y2)
+        """
+        x1, y1, x2, y2 = rectangle
+        rec = self.get_rectangle(age)
+        if rec[2] < x1 or rec[0] > x2 or rec[3] < y1 or rec[1] > y2:
+            return
+
+        if age == 0:
+            branches = self.iter_age_branches(0)
+        else:
+            dx, dy = self.offset
+            # Enlarge the unmoved rectangle a bit, the moved coordinates may be rounded
+            positions = self.get_index(age).query((x1-dx-1e-6, y1-dy-1e-6, x2-dx+1e-6, y2-dy+1e-6))
+            branches = self._iter_positions_branches(age, positions, dx, dy)
+
+        for branch in branches:
+            if (max(branch[0], branch[2]) >= x1 and min(branch[0], branch[2]) <= x2 and
+                    max(branch[1], branch[3]) >= y1 and min(branch[1], branch[3]) <= y2):
+                yield branch
+
+    def _iter_positions_branches(self, age, positions, dx, dy):
+        """Iterate over the branches of an age at sorted positions, moved by a offset.
+
+        Every node is read once, the parent of neighbouring branches only for the first.
+        """
+        get_parent, get_node = (
+            level.get_node if isinstance(level, Level) else
+            (lambda pos, level=level: (level[2*pos], level[2*pos+1]))
+            for level in self.nodes[age-1:age+1]
+        )
+        parent = None
+        for n in positions:
+            if n//self.comp != parent:
+                parent = n//self.comp
+                x1, y1 = get_parent(parent)
+                x1, y1 = x1+dx, y1+dy
+            x2, y2 = get_node(n)
+            yield (x1, y1, x2+dx, y2+dy)
+
+    def query(self, rectangle, ages=None):
+        """Iterate over the branches of the tree, which cross a rectangle.
+
+        Args:
+            rectangle (tupel): The rectangle. (x1, y1, x2, y2)
+            ages (array): Contains the ages you want to iterate. All ages by default.
+
+        Yields:
+            tupel: The age and the coordinates of a branch. (age, (x1, y1, x2, y2))
+        """
+        for age in range(self.age+1) if ages is None else ages:
+            for branch in self.query_age(age, rectangle):
+                yield age, branch
+
+    def iter_nodes(self, ages=None):
+        """Iterate over the nodes of the tree without building lists.
+
+        Args:
+            ages (array): Contains the ages you want to iterate. All ages by default.
+
+        Yields:
+            tupel: The age and the coordinates of a node. (age, (x, y))
+        """
+        for age in range(self.age+1) if ages is None else ages:
+            for node in self.iter_age_nodes(age):
+                yield age, node
+
+    def iter_branches(self, ages=None):
+        """Iterate over the branches of the tree without building lists.
+
+        Args:
+            ages (array): Contains the ages you want to iterate. All ages by default.
+
+        Yields:
+            tupel: The age and the coordinates of a branch. (age, (x1, y1, x2, y2))
+        """
+        for age in range(self.age+1) if ages is None else ages:
+            for branch in self.iter_age_branches(age):
+                yield age, branch
 
     def move(self, delta):
         """Move the tree.
 
+        Only the offset is changed, the nodes are moved when they are read.
+
         Args:
             delta (tupel): The adjustment of the position.
         """
         pos = self.pos
         self.pos = (pos[0]+delta[0], pos[1]+delta[1], pos[2]+delta[0], pos[3]+delta[1])
-
-        # Move all nodes
-        for age in self.nodes:
-            for node in age:
-                node.move(delta)
+        self.offset = (self.offset[0]+delta[0], self.offset[1]+delta[1])
 
     def move_in_rectangle(self):
         """Move the tree so that the tree fits in the rectangle."""
-        rec = self.get_rectangle()
-        self.move((-rec[0], -rec[1]))
+        with self.stats.timer("move"):
+            rec = self.get_rectangle()
+            self.move((-rec[0], -rec[1]))
 
-    def grow(self, times=1):
+    def grow(self, times=1, callback=None):
         """Let the tree grow.
 
         Args:
             times (integer): Indicate how many times the tree will grow.
+            callback (function): Called with the tree after every generation.
+                If it returns False, the growth is stopped.
+
+        Raises:
+            BudgetError: If the tree would exceed its budget. Nothing is grown then.
         """
-        self.nodes.append([])
+        for _ in self.iter_grow(times):
+            if callback is not None and callback(self) is False:
+                break
 
-        for n, node in enumerate(self.nodes[self.age]):
-            if self.age == 0:
-                p_node = Node(self.pos[:2])
-            else:
-                p_node = self._get_node_parent(self.age-1, n)
-            angle = node.get_node_angle(p_node)
-            for i in range(self.comp):
-                tot_angle = self.__get_total_angle(angle, i)
-                length = self.__get_total_length(self.age+1, i)
-                self.nodes[self.age+1].append(node.make_new_node(length, tot_angle))
+    def iter_grow(self, times=1):
+        """Let the tree grow generation by generation.
 
-        self.age += 1
+        Every generation is completely added to the tree before the age is yielded,
+        so the growth can be stopped between two generations and resumed later
+        by calling this method (or grow) again.
 
-        if times > 1:
-            self.grow(times-1)
+        Args:
+            times (integer): Indicate how many times the tree will grow.
+
+        Yields:
+            int: The age of the tree after each generation.
+
+        Raises:
+            BudgetError: If the tree would exceed its budget. Nothing is grown then.
+        """
+        self.check_budget(self.age+times)
+        for _ in range(times):
+            with self.stats.timer("grow"):
+                self._add_generation(*(self.engine.grow() if self.instances is None else self.instances.grow()))
+            yield self.age
+
+    def grow_parallel(self, times=1, split_age=None, workers=None):
+        """Let the tree grow, splitted into subtrees growing in worker processes.
+
+        Until the split age the tree grows as usual. Then every node of this age is the
+        root of a subtree, which grows on its own. The subtrees are stitched back into
+        the nodes in their order, so the tree looks like grown with grow.
+        With sigma and a seed, the random values of every branch depend only on its
+        position (see Engine), so the tree is the same as grown with grow, no matter
+        how many workers are used. Without seed, every worker draws its own values.
+
+        Args:
+            times (integer): Indicate how many times the tree will grow.
+            split_age (int): The age, at which the tree is splitted.
+                By default the first age with at least SPLIT_NODES nodes.
+            workers (int): The number of worker processes. Defaults to the number of cpus.
+
+        Raises:
+            BudgetError: If the tree would exceed its budget. Nothing is grown then.
+        """
+        if self.instances is not None:
+            # The nodes of instanced trees are computed when read, there is nothing to split
+            self.grow(times)
+            return
+
+        # Imported here, multiprocessing is slow to import and only needed for this
+        from concurrent.futures import ProcessPoolExecutor
+
+        target = self.age+times
+        self.check_budget(target)
+        workers = workers or os.cpu_count() or 1
+
+        if split_age is None:
+            split_age = self.age
+            while split_age < target and self.get_node_age_sum(split_age) < SPLIT_NODES:
+                split_age += 1
+        self.grow(max(0, min(split_age, target)-self.age))
+        if self.age == target:
+            return
+
+        age = self.age
+        nodes = self.nodes[age]
+        angles = self.angles[age]
+        count = len(angles)
+        size = -(-count // (4*workers))
+        # Copied into arrays, the nodes of a loaded tree are memoryviews, which can not be pickled
+        jobs = [
+            (self.branches, self.sigma, self.length, type(self.engine), self.seed, age, target-age, n,
+             array("d", nodes[2*n:2*(n+size)]), array("d", angles[n:n+size]))
+            for n in range(0, count, size)
+        ]
+
+        levels = [(array("d"), array("d")) for _ in range(target-age)]
+        with self.stats.timer("grow"), ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(_grow_subtrees, jobs):
+                for level, part in zip(levels, result):
+                    level[0].extend(part[0])
+                    level[1].extend(part[1])
 
-    def draw_on(self, canvas, stem_color, leaf_color, thickness, ages=None):
+            for level in levels:
+                self._add_generation(*level)
+
+    def draw_on(self, canvas, stem_color, leaf_color, thickness, ages=None, **kwargs):
         """Draw the tree on a canvas.
 
         Args:
-            canvas (object): The canvas, you want to draw the tree on. Supported canvases: svgwrite.Drawing and PIL.Image (You can also add your custom libraries.)
+            canvas (object): The canvas, you want to draw the tree on. Supported canvases: svgwrite.Drawing and PIL.Image (You can also add your custom libraries with Tree.backends.register_drawer.)
             stem_color (tupel): Color or gradient for the stem of the tree.
             leaf_color (tupel): Color for the leaf (= the color for last iteration).
             thickness (int): The start thickness of the tree.
+            **kwargs: Further options for the drawer, e.g. viewport or min_length.
+
+        Raises:
+            UnsupportedCanvasError: If there is no drawer for the canvas.
         """
-        if canvas.__module__ in SUPPORTED_CANVAS:
-            drawer = SUPPORTED_CANVAS[canvas.__module__]
-            drawer(self, canvas, stem_color, leaf_color, thickness, ages).draw()
+        drawer = get_drawer(canvas)
+        drawer(self, canvas, stem_color, leaf_color, thickness, ages, **kwargs).draw()
 
-    def __get_total_angle(self, angle, pos):
-        """Get the total angle."""
-        tot_angle = angle - self.branches[pos][1]
-        if self.sigma[1] != 0:
-            tot_angle += gauss(0, self.sigma[1]) * pi
-        return tot_angle
+    def _add_generation(self, level, angles, rectangle=None):
+        """Add a grown generation to the tree.
 
-    def __get_total_length(self, age, pos):
-        length = self.get_branch_length(age, pos)
-        if self.sigma[0] != 0:
-            length *= (1+gauss(0, self.sigma[0]))
-        return length
+        Args:
+            level (array): The coordinates of the new nodes. [x1, y1, x2, y2, ...]
+            angles (array): The angles of the new nodes.
+            rectangle (tupel): The rectangle around the new nodes, if already known.
+        """
+        self.nodes.append(level)
+        self.angles.append(angles)
+        self.rectangles.append(get_bounds(level) if rectangle is None else rectangle)
+        self.age += 1
+        self.stats.count("nodes", len(angles))
 
-    def _get_node_parent(self, age, pos):
-        """Get the parent node of node, whch is located in tree's node list.
+def _grow_subtrees(job):
+    """Grow subtrees of a tree in a worker process.
 
-        Returns:
-            object: The parent node.
-        """
-        return self.nodes[age][int(pos / self.comp)]
+    The roots of a job follow each other in their age, so the nodes of the subtrees
+    follow each other in every age too and are grown together.
+
+    Args:
+        job (tupel): The branches, sigma, length, engine class and seed of the tree, the age
+            of the roots, how many times the subtrees will grow, the position of the first
+            root and the coordinates and angles of the roots.
+
+    Returns:
+        list: The coordinates and the angles of the nodes of every grown age.
+    """
+    branches, sigma, length, engine, seed, age, times, first, nodes, angles = job
+    tree = Tree(branches=branches, sigma=sigma)
+    tree.length = length
+    grower = engine(tree)
+    grower.seed(seed)
+
+    levels = []
+    for i in range(times):
+        nodes, angles = grower.step(nodes, angles, age+i, first*tree.comp**i)
+        levels.append((nodes, angles))
+    return levels
 
 def generate_branches(scales=None, angles=None, shift_angle=0):
     """Generates branches with alternative system.
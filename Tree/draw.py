@@ -1,15 +1,30 @@
 """
 Module for drawing trees.
 """
-from PIL import ImageDraw
-import svgwrite
+from math import degrees, floor
+
+from Tree.backends import DRAWERS
 from Tree.utils import convert_color
 
 class Drawer(object):
-    """A generic class for drawing tree on acanvas."""
-    def __init__(self, tree, canvas, stem_color=(255, 255, 255), leaf_color=(230, 120, 34), thickness=1, ages=None):
+    """A generic class for drawing tree on acanvas.
+
+    Attributes:
+        styles (dict): Holding the color, the color as svg string and the thickness
+            for every age drawn. Computed once per draw.
+        stats (object): The Stats counting the drawn segments, by default the one of the tree.
+    """
+    def __init__(self, tree, canvas, stem_color=(255, 255, 255), leaf_color=(230, 120, 34), thickness=1, ages=None,
+                 viewport=None, min_length=None, leaf_fill=False, stats=None, gradient_age=None):
         """Constructor of drawer.
 
+        With min_length, ages with branches shorter than min_length are not drawn.
+        If k is the last drawn age and s the largest scale of the branches, every
+        branch not drawn lies within the radius r = length * s^(k+1) / (1-s) around
+        a node of age k, and r < min_length / (1-s). So (without sigma) the image
+        differs only within r pixels of the drawn tips. With leaf_fill, these circles
+        are filled with the leaf color.
+
         Args:
             tree (object): The tree, which should drawn on canvas.
             canvas (object): The canvas for drawing the tree.
@@ -17,6 +32,12 @@ class Drawer(object):
             leaf_color (tupel): Color for the leaf (= the color for last iteration).
             thickness (int): The start thickness of the tree.
             ages (array): Contains the ages you want to draw.
+            viewport (tupel): If given, only this rectangle of the tree is drawn, with its
+                upper left corner at (0, 0) of the canvas. (x1, y1, x2, y2)
+            min_length (float): If given, the length in pixels, below which branches are not drawn.
+            leaf_fill (bool): Fills the place of the branches not drawn with the leaf color.
+            stats (object): The Stats collecting the draw time and the drawn segments.
+            gradient_age (int): The age, over which the stem gradient is spread. The age of the tree by default.
 
         Returns:
             int: The thickness of the branch/es
@@ -27,6 +48,12 @@ class Drawer(object):
         self.leaf_color = leaf_color
         self.thickness = thickness
         self.ages = range(tree.age+1) if ages is None else ages
+        self.viewport = viewport
+        self.min_length = min_length
+        self.leaf_fill = leaf_fill
+        self.stats = tree.stats if stats is None else stats
+        self.gradient_age = gradient_age
+        self.styles = {}
 
     def _get_thickness(self, age):
         """Get the thickness depending on age.
@@ -56,11 +83,28 @@ class Drawer(object):
         if len(color) == 3:
             return color
 
+        gradient_age = tree.age if self.gradient_age is None else self.gradient_age
         diff = [color[i+3]-color[i] for i in range(3)]
-        per_age = [diff[i]/(tree.age-1) for i in range(3)]
+        per_age = [diff[i]/max(1, gradient_age-1) for i in range(3)]
 
         return tuple([int(color[i]+per_age[i]*age) for i in range(3)])
 
+    def _get_styles(self, last_age):
+        """Get the style of every age drawn.
+
+        Args:
+            last_age (int): The last age drawn.
+
+        Returns:
+            dict: Holding (color, svg color, thickness) for every age.
+        """
+        styles = {}
+        for age in range(last_age+1):
+            if age in self.ages:
+                color = self._get_color(age)
+                styles[age] = (color, convert_color(color), self._get_thickness(age))
+        return styles
+
     def _draw_branch(self, branch, color, thickness, age):
         """Placeholder for specific draw methods for a branch.
 
@@ -72,52 +116,271 @@ class Drawer(object):
         """
         pass
 
+    def _draw_fill(self, nodes, color, radius):
+        """Placeholder for specific draw methods for filling circles around nodes.
+
+        Args:
+            nodes (iterator): The coordinates of the nodes.
+            color (tupel): The color of the circles.
+            radius (float): The radius of the circles.
+        """
+        pass
+
+    def _draw_age(self, branches, color, thickness, age):
+        """Draw all branches of an age, which share color and thickness.
+
+        Args:
+            branches (iterator): The coordinates of the branches.
+            color (tupel): The color of the branches.
+            thickness (int): The thickness of the branches.
+            age (int): The age of the tree the branches are drawn.
+        """
+        for branch in branches:
+            self._draw_branch(branch, color, thickness, age)
+
+    def _get_viewport(self, thickness):
+        """Get the viewport, enlarged by the thickness of the branches.
+
+        Returns:
+            tupel: (x1, y1, x2, y2)
+        """
+        x1, y1, x2, y2 = self.viewport
+        return (x1-thickness, y1-thickness, x2+thickness, y2+thickness)
+
+    def _iter_visible(self, age, thickness):
+        """Iterate over the branches of an age, which may cross the viewport.
+
+        Args:
+            age (int): The age of the branches.
+            thickness (int): The thickness of the branches.
+
+        Yields:
+            tupel: The coordinates of a visible branch, relative to the viewport.
+        """
+        dx, dy = self.viewport[:2]
+        count = 0
+        for branch in self.tree.query_age(age, self._get_viewport(thickness)):
+            count += 1
+            yield (branch[0]-dx, branch[1]-dy, branch[2]-dx, branch[3]-dy)
+        self.stats.count("segments", count)
+
+    def _get_last_age(self):
+        """Get the last age, which branches are at least min_length long.
+
+        Returns:
+            int: The last age to draw.
+        """
+        scale = max(branch[0] for branch in self.tree.branches)
+        if self.min_length is None or scale >= 1:
+            return self.tree.age
+        return max(0, min(self.tree.age, int(self.tree.get_steps_branch_len(self.min_length))))
+
+    def _iter_fill(self, age, radius):
+        """Iterate over the nodes of an age, which circles may cross the viewport.
+
+        Yields:
+            tupel: The coordinates of a node, relative to the viewport.
+        """
+        if self.viewport is None:
+            for node in self.tree.iter_age_nodes(age):
+                yield node
+            return
+
+        x1, y1, x2, y2 = self._get_viewport(radius)
+        dx, dy = self.viewport[:2]
+        for x, y in self.tree.iter_age_nodes(age):
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                yield (x-dx, y-dy)
+
     def draw(self):
         """Draws the tree.
 
         Args:
             ages (array): Contains the ages you want to draw.
         """
-        for age, level in enumerate(self.tree.get_branches()):
-            if age in self.ages:
-                thickness = self._get_thickness(age)
-                color = self._get_color(age)
-                for branch in level:
-                    self._draw_branch(branch, color, thickness, age)
+        with self.stats.timer("draw"):
+            last_age = self._get_last_age()
+            self.styles = self._get_styles(last_age)
+            for age, (color, _, thickness) in sorted(self.styles.items()):
+                if self.viewport is None:
+                    branches = self.tree.iter_age_branches(age)
+                    self.stats.count("segments", self.tree.get_node_age_sum(age))
+                else:
+                    branches = self._iter_visible(age, thickness)
+                self._draw_age(branches, color, thickness, age)
+
+            if self.leaf_fill and last_age < self.tree.age:
+                scale = max(branch[0] for branch in self.tree.branches)
+                radius = self.tree.length * pow(scale, last_age+1) / (1-scale)
+                self._draw_fill(self._iter_fill(last_age, radius), self.leaf_color, radius)
 
 class PilDrawer(Drawer):
-    """A drawer class for drawing on PIL/Pillow images."""
-    def _draw_branch(self, branch, color, thickness, age):
-        ImageDraw.Draw(self.canvas).line(branch, color, thickness)
+    """A drawer class for drawing on PIL/Pillow images.
+
+    The draw context is created once per draw and shared by all branches.
+
+    Attributes:
+        context (object): The ImageDraw.Draw of the canvas.
+    """
+    def _draw_age(self, branches, color, thickness, age):
+        line = self.context.line
+        if self.viewport is not None:
+            # PIL cuts the coordinates towards zero, so branches starting left of or above the
+            # viewport would move by a pixel. Rounded down, they are drawn as on the whole image.
+            branches = (tuple(map(floor, branch)) for branch in branches)
+        for branch in branches:
+            line(branch, fill=color, width=thickness)
+
+    def _draw_fill(self, nodes, color, radius):
+        ellipse = self.context.ellipse
+        # Rounded down like the branches, circles reaching over the border of the image included
+        for x, y in nodes:
+            ellipse((floor(x-radius), floor(y-radius), floor(x+radius), floor(y+radius)), fill=color)
+
+    def draw(self):
+        # Imported here, so that PIL is only imported when a image is drawn
+        from PIL import ImageDraw
+        self.context = ImageDraw.Draw(self.canvas)
+        Drawer.draw(self)
 
 class SvgDrawer(Drawer):
     """A drawer class for drawing on svg documents.
 
+    The stroke of the branches is set once on the group of their age.
+
+    With instances, a tree without sigma is drawn with <defs> and <use> elements.
+    The branches of an age are defined once below a single node, then copied onto
+    the children of a node one age older, and so on until the root. So every age
+    needs as many definitions as it is old, instead of a line per branch, and the
+    ages are still painted one after another. With a viewport, the copies are only
+    moved, not skipped outside of it.
+
     Attributes:
-        group (list): Saves the groups created for every age.
+        group (dict): Saves the groups created for every age.
+        instances (bool): Draws the tree as copies of the templates of its ages.
     """
-    def __init__(self, tree, canvas, color=(255, 255, 255), thickness=1):
-        super(SvgDrawer, self).__init__(tree, canvas, color, thickness)
-        self.group = []
+    def __init__(self, *args, instances=False, **kwargs):
+        super(SvgDrawer, self).__init__(*args, **kwargs)
+        self.group = {}
+        self.instances = instances
+        self._templates = {}
 
     def _draw_branch(self, branch, color, thickness, age):
-        color = convert_color(color)
         self.group[age].add(
             self.canvas.line(
                 start=branch[:2],
-                end=branch[2:],
-                stroke=color,
-                stroke_width=thickness
+                end=branch[2:]
             )
         )
 
+    def _draw_fill(self, nodes, color, radius):
+        group = self.canvas.add(self.canvas.g(fill=convert_color(color)))
+        if self.instances:
+            group.add(self._copy(self.canvas.circle(center=(0, 0), r=radius), self._get_last_age()))
+            return
+        for node in nodes:
+            group.add(self.canvas.circle(center=node, r=radius))
+
+    def _draw_age(self, branches, color, thickness, age):
+        self.group[age] = self.canvas.add(self.canvas.g(
+            stroke=self.styles[age][1],
+            stroke_width=thickness
+        ))
+        if self.instances and age > 0:
+            lines = self.canvas.g()
+            for x, y, _ in self._get_template(age-1):
+                lines.add(self.canvas.line(start=(0, 0), end=(x, y)))
+            self.group[age].add(self._copy(lines, age-1))
+        else:
+            Drawer._draw_age(self, branches, color, thickness, age)
+
+    def _get_template(self, age):
+        """Get the children of a node of an age, relative to the node, computed once per draw."""
+        if age not in self._templates:
+            self._templates[age] = self.tree.get_template(age)
+        return self._templates[age]
+
+    def _copy(self, element, age):
+        """Copy a element onto every node of an age.
+
+        Args:
+            element (object): The svg element, drawn relative to a node at (0, 0) with the angle 0.
+            age (int): The age of the nodes.
+
+        Returns:
+            object: A use element, which draws the copies.
+        """
+        for level in range(age-1, -1, -1):
+            self.canvas.defs.add(element)
+            group = self.canvas.g()
+            for x, y, angle in self._get_template(level):
+                group.add(self._use(element, x, y, angle))
+            element = group
+
+        self.canvas.defs.add(element)
+        x, y = next(self.tree.iter_age_nodes(0))
+        if self.viewport is not None:
+            x, y = x-self.viewport[0], y-self.viewport[1]
+        return self._use(element, x, y, self.tree.angles[0][0])
+
+    def _use(self, element, x, y, angle):
+        """Get a use element, which draws a element moved to a node and rotated by its angle."""
+        use = self.canvas.use(element)
+        use.translate(x, y)
+        use.rotate(degrees(-angle))
+        return use
+
+    def draw(self):
+        self.group = {}
+        self._templates = {}
+        Drawer.draw(self)
+
+class SvgStreamDrawer(Drawer):
+    """A drawer class for writing svg documents straight into a file.
+
+    No svgwrite elements are built. The document is written age by age and every
+    age becomes a single path, so the memory stays flat and the file small.
+    The canvas is a file opened for writing text.
+
+    Attributes:
+        precision (int): The number of decimals written for the coordinates.
+    """
+    precision = 2
+
+    def _draw_age(self, branches, color, thickness, age):
+        self.canvas.write('<g stroke="{}" stroke-width="{}" fill="none"><path d="'.format(
+            self.styles[age][1], thickness))
+        segment = "M{0:.{4}f},{1:.{4}f}L{2:.{4}f},{3:.{4}f}"
+        chunk = []
+        for branch in branches:
+            chunk.append(segment.format(*branch, self.precision))
+            if len(chunk) == 4096:
+                self.canvas.write("".join(chunk))
+                chunk = []
+        self.canvas.write("".join(chunk))
+        self.canvas.write('"/></g>\n')
+
+    def _draw_fill(self, nodes, color, radius):
+        # Round caps of empty lines are circles
+        self.canvas.write('<g stroke="{}" stroke-width="{}" stroke-linecap="round"><path d="'.format(
+            convert_color(color), 2*radius))
+        point = "M{0:.{2}f},{1:.{2}f}h0"
+        self.canvas.write("".join(point.format(*node, self.precision) for node in nodes))
+        self.canvas.write('"/></g>\n')
+
     def draw(self):
-        self.group = []
-        for _ in self.ages:
-            self.group.append(self.canvas.add(svgwrite.container.Group()))
+        if self.viewport is None:
+            rec = self.tree.get_rectangle()
+        else:
+            rec = (0, 0, self.viewport[2]-self.viewport[0], self.viewport[3]-self.viewport[1])
+        size = (rec[2]-rec[0], rec[3]-rec[1])
+        self.canvas.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        self.canvas.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" baseProfile="full" '
+            'width="{0}" height="{1}" viewBox="{2} {3} {0} {1}">\n'.format(size[0], size[1], rec[0], rec[1])
+        )
         Drawer.draw(self)
+        self.canvas.write("</svg>\n")
 
-SUPPORTED_CANVAS = {
-    "PIL.Image": PilDrawer,
-    "svgwrite.drawing": SvgDrawer
-}
+# The drawers are registered in Tree.backends, this is kept for adding custom drawers
+SUPPORTED_CANVAS = DRAWERS
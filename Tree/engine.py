@@ -0,0 +1,211 @@
+"""
+Module for growing trees.
+"""
+from array import array
+from hashlib import sha256
+from math import cos, sin, pi
+import random
+
+# Number of parents, which children get their random values from the same generator
+RANDOM_BLOCK = 1024
+
+class Engine(object):
+    """A generic class for growing a tree generation by generation.
+
+    With a seed, the random values for sigma are not drawn one after another.
+    The parents of every age are split into blocks of RANDOM_BLOCK and the children
+    of a block get their values from own generators for the angles and the lengths,
+    seeded by the seed, the age and the block. Only the values up to the last child
+    needed are drawn. So the values of a child only depend on its position, and a tree
+    grows the same, whether it is grown at once or in parts, e.g. by grow_parallel.
+
+    Attributes:
+        rng (object): The random generator used for sigma without seed.
+        key (int): The seed, from which the generators of the blocks are derived.
+    """
+    def __init__(self, tree, rng=None):
+        """Constructor of engine.
+
+        Args:
+            tree (object): The tree, which should be grown.
+            rng (object): The random generator used for sigma. The global one by default.
+        """
+        self.tree = tree
+        self.rng = rng
+        self.key = None
+
+    def seed(self, seed):
+        """Give the engine a own random generator.
+
+        Args:
+            seed (int): The seed of the generator. None for a random seed.
+        """
+        self.key = seed
+        self.rng = self._get_rng(seed)
+
+    def grow(self):
+        """Grow the next generation of the tree.
+
+        Returns:
+            tupel: The coordinates of the new nodes [x1, y1, x2, y2, ...] and their angles.
+        """
+        tree = self.tree
+        return self.step(tree.nodes[tree.age], tree.angles[tree.age], tree.age)
+
+    def step(self, nodes, angles, age, first=0):
+        """Placeholder for specific methods growing the children of nodes.
+
+        Args:
+            nodes (array): The coordinates of the nodes. [x1, y1, x2, y2, ...]
+            angles (array): The angles of the nodes.
+            age (int): The age of the nodes.
+            first (int): The position of the first node in its age.
+
+        Returns:
+            tupel: The coordinates of the children [x1, y1, x2, y2, ...] and their angles.
+        """
+        raise NotImplementedError
+
+    def get_sigmas(self, age, first, count):
+        """Get the random values for the children of nodes.
+
+        Args:
+            age (int): The age of the nodes.
+            first (int): The position of the first node in its age.
+            count (int): The number of nodes.
+
+        Returns:
+            tupel: The values for the angles and for the lengths of the children,
+                each None if its sigma is 0.
+        """
+        comp = self.tree.comp
+        sigmas = (self.tree.sigma[1], self.tree.sigma[0])
+        if self.key is None:
+            return tuple(None if sigma == 0 else self._get_gauss(self.rng, sigma, count*comp) for sigma in sigmas)
+
+        parts = ([], [])
+        for block in range(first // RANDOM_BLOCK, (first+count-1) // RANDOM_BLOCK + 1):
+            start = max(first-block*RANDOM_BLOCK, 0) * comp
+            end = min(first+count-block*RANDOM_BLOCK, RANDOM_BLOCK) * comp
+            for kind, (sigma, part) in enumerate(zip(sigmas, parts)):
+                if sigma != 0:
+                    rng = self._get_rng(_get_block_seed(self.key, age, block, kind))
+                    part.append(self._get_gauss(rng, sigma, end)[start:])
+        return tuple(None if sigma == 0 else self._join(part) for sigma, part in zip(sigmas, parts))
+
+    def _get_rng(self, seed):
+        """Placeholder for specific methods creating a random generator.
+
+        Args:
+            seed (int): The seed of the generator. None for a random seed.
+        """
+        raise NotImplementedError
+
+    def _get_gauss(self, rng, sigma, count):
+        """Placeholder for specific methods drawing count values of a gaussian distribution."""
+        raise NotImplementedError
+
+    def _join(self, parts):
+        """Placeholder for specific methods joining the values of several blocks."""
+        raise NotImplementedError
+
+class PythonEngine(Engine):
+    """A engine growing every branch with plain python."""
+    def __init__(self, tree, rng=None):
+        super(PythonEngine, self).__init__(tree, random if rng is None else rng)
+
+    def step(self, nodes, angles, age, first=0):
+        tree = self.tree
+        level = array("d")
+        new_angles = array("d")
+        lengths = [tree.get_branch_length(age+1, i) for i in range(tree.comp)]
+        angle_sigmas, length_sigmas = self.get_sigmas(age, first, len(angles))
+
+        for n, angle in enumerate(angles):
+            x, y = nodes[2*n], nodes[2*n+1]
+            for i in range(tree.comp):
+                tot_angle = angle - tree.branches[i][1]
+                length = lengths[i]
+                if angle_sigmas is not None:
+                    tot_angle += angle_sigmas[n*tree.comp+i] * pi
+                if length_sigmas is not None:
+                    length *= (1+length_sigmas[n*tree.comp+i])
+                level.append(cos(-tot_angle)*length+x)
+                level.append(sin(-tot_angle)*length+y)
+                new_angles.append(tot_angle)
+
+        return level, new_angles
+
+    def _get_rng(self, seed):
+        return random.Random(seed)
+
+    def _get_gauss(self, rng, sigma, count):
+        gauss = rng.gauss
+        return [gauss(0, sigma) for _ in range(count)]
+
+    def _join(self, parts):
+        return [value for part in parts for value in part]
+
+class NumpyEngine(Engine):
+    """A engine growing a whole generation at once with numpy.
+
+    The operations are the same as in PythonEngine, only applied on arrays,
+    so without sigma the geometry is bit for bit the one grown with plain python.
+    The random values for sigma are drawn in bulk for the whole generation or block.
+    Numpy is imported with the first engine, not with this module.
+
+    Attributes:
+        numpy (module): The numpy module.
+    """
+    def __init__(self, tree, rng=None):
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("The numpy engine requires numpy to be installed.")
+        self.numpy = numpy
+        super(NumpyEngine, self).__init__(tree, numpy.random if rng is None else rng)
+
+    def step(self, nodes, angles, age, first=0):
+        numpy = self.numpy
+        tree = self.tree
+        nodes = numpy.frombuffer(nodes, dtype=float).reshape(-1, 2)
+        angle = numpy.frombuffer(angles, dtype=float)
+        tot_angle = angle[:, None] - numpy.array([branch[1] for branch in tree.branches], dtype=float)
+        length = numpy.array([tree.get_branch_length(age+1, i) for i in range(tree.comp)], dtype=float)
+        length = numpy.broadcast_to(length, tot_angle.shape)
+
+        angle_sigmas, length_sigmas = self.get_sigmas(age, first, len(angle))
+        if angle_sigmas is not None:
+            tot_angle = tot_angle + angle_sigmas.reshape(tot_angle.shape) * pi
+        if length_sigmas is not None:
+            length = length * (1+length_sigmas.reshape(length.shape))
+
+        level = numpy.empty(tot_angle.shape + (2,))
+        level[..., 0] = numpy.cos(-tot_angle)*length + nodes[:, 0, None]
+        level[..., 1] = numpy.sin(-tot_angle)*length + nodes[:, 1, None]
+
+        return array("d", level.tobytes()), array("d", tot_angle.tobytes())
+
+    def _get_rng(self, seed):
+        return self.numpy.random.default_rng(seed)
+
+    def _get_gauss(self, rng, sigma, count):
+        return rng.normal(0, sigma, count)
+
+    def _join(self, parts):
+        return self.numpy.concatenate(parts)
+
+ENGINES = {
+    "python": PythonEngine,
+    "numpy": NumpyEngine
+}
+
+def _get_block_seed(seed, age, block, kind):
+    """Derive the seed of a block of parents from the seed of the tree.
+
+    Returns:
+        int: The seed of the generator for the angles (kind 0) or the lengths (kind 1)
+            of the children of the block.
+    """
+    digest = sha256("{}/{}/{}/{}".format(seed, age, block, kind).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
@@ -0,0 +1,74 @@
+"""
+Module for finding the branches of a tree in a region.
+"""
+from array import array
+from math import sqrt
+
+# Average number of branches per cell of a grid
+BRANCHES_PER_CELL = 4
+
+class GridIndex(object):
+    """A uniform grid over branches, remembering which branches cross every cell.
+
+    Attributes:
+        rectangle (tupel): The rectangle covered by the grid. (x1, y1, x2, y2)
+        shape (tupel): The number of cells. (columns, rows)
+        cells (dict): Holding the positions of the branches crossing every cell.
+    """
+    def __init__(self, branches, rectangle, count):
+        """Constructor of the index.
+
+        Args:
+            branches (iterator): The coordinates of the branches. (x1, y1, x2, y2)
+            rectangle (tupel): The rectangle around all branches. (x1, y1, x2, y2)
+            count (int): The number of branches.
+        """
+        self.rectangle = rectangle
+        side = max(1, int(sqrt(count / BRANCHES_PER_CELL)))
+        self.shape = (side, side)
+        self.cells = {}
+
+        for pos, branch in enumerate(branches):
+            columns, rows = self._get_cells((
+                min(branch[0], branch[2]), min(branch[1], branch[3]),
+                max(branch[0], branch[2]), max(branch[1], branch[3])
+            ))
+            for row in rows:
+                for column in columns:
+                    cell = self.cells.get((column, row))
+                    if cell is None:
+                        cell = self.cells[(column, row)] = array("l")
+                    cell.append(pos)
+
+    def query(self, rectangle):
+        """Get the branches, which cells cross a rectangle.
+
+        The branches are candidates, they do not have to cross the rectangle.
+
+        Args:
+            rectangle (tupel): The rectangle. (x1, y1, x2, y2)
+
+        Returns:
+            list: The sorted positions of the branches.
+        """
+        columns, rows = self._get_cells(rectangle)
+        cells = [self.cells[(column, row)] for row in rows for column in columns if (column, row) in self.cells]
+        if len(cells) == 1:
+            return list(cells[0])
+        return sorted(set(pos for cell in cells for pos in cell))
+
+    def _get_cells(self, rectangle):
+        """Get the columns and rows of the cells crossing a rectangle.
+
+        Returns:
+            tupel: The range of the columns and the range of the rows.
+        """
+        ranges = []
+        for i in range(2):
+            start, end = self.rectangle[i], self.rectangle[i+2]
+            size = (end-start) / self.shape[i] or 1
+            # Coordinates on the far edge of the grid belong to the last cell
+            first = min(self.shape[i]-1, max(0, int((rectangle[i]-start) // size)))
+            last = min(self.shape[i]-1, int((rectangle[i+2]-start) // size))
+            ranges.append(range(first, last+1))
+        return ranges
@@ -0,0 +1,171 @@
+"""
+Module for trees without sigma, which compute their nodes when they are read.
+"""
+from array import array
+from itertools import islice
+from math import cos, sin
+
+# Maximum number of nodes computed at once, when an age is read
+CHUNK_NODES = 4096
+
+class Instances(object):
+    """The nodes and angles of a tree without sigma, computed from the root when they are read.
+
+    Without sigma, the children of every node of an age are the same template, only
+    moved to the node and rotated by its angle. So only the length of every branch of
+    every age is kept, and an age is computed chunk by chunk from the nodes of a younger
+    age, with the same operations as the python engine uses for growing.
+
+    Attributes:
+        tree (object): The tree.
+        lengths (list): Holding the length of every branch leading to the nodes of an age.
+        path (list): The position, coordinates and angles of the ancestors of the node read last,
+            so that reading nodes near each other computes their common ancestors only once.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.lengths = [[]]
+        self.path = [(0, tree.nodes[0], tree.angles[0])]
+
+    def grow(self):
+        """Add the next age.
+
+        The nodes of the age are computed once, for the rectangle around them.
+
+        Returns:
+            tupel: The Level of the coordinates, the Level of the angles and the rectangle
+                around the nodes of the new age. (x1, y1, x2, y2)
+        """
+        tree = self.tree
+        age = len(self.lengths)
+        self.lengths.append([tree.get_branch_length(age, i) for i in range(tree.comp)])
+
+        bounds = []
+        for coords, _ in self.iter_chunks(age):
+            xs, ys = coords[0::2], coords[1::2]
+            bounds.append((min(xs), min(ys), max(xs), max(ys)))
+        rectangle = (min(rec[0] for rec in bounds), min(rec[1] for rec in bounds),
+                     max(rec[2] for rec in bounds), max(rec[3] for rec in bounds))
+        return Level(self, age, 0), Level(self, age, 1), rectangle
+
+    def get(self, age, pos):
+        """Compute a single node from the root down.
+
+        Only the ancestors not shared with the node read before are computed.
+
+        Args:
+            age (int): The age of the node.
+            pos (int): The position of the node in its age.
+
+        Returns:
+            tupel: The coordinates and the angle of the node. (x, y, angle)
+        """
+        comp = self.tree.comp
+        path = self.path
+        level = min(age, len(path)-1)
+        while path[level][0] != pos // comp**(age-level):
+            level -= 1
+        del path[level+1:]
+
+        _, coords, angles = path[level]
+        for level in range(level, age):
+            ancestor = pos // comp**(age-level-1)
+            child = ancestor % comp
+            coords, angles = self._step(coords, angles, level, [self.tree.branches[child]], [child])
+            path.append((ancestor, coords, angles))
+        return coords[0], coords[1], angles[0]
+
+    def iter_chunks(self, age):
+        """Compute the nodes of an age chunk by chunk, in the order they are grown.
+
+        Args:
+            age (int): The age of the nodes.
+
+        Yields:
+            tupel: The coordinates of at most CHUNK_NODES nodes [x1, y1, x2, y2, ...] and their angles.
+        """
+        if age == 0:
+            yield list(self.tree.nodes[0]), list(self.tree.angles[0])
+            return
+
+        comp = self.tree.comp
+        depth = 1
+        while depth < age and comp**(depth+1) <= CHUNK_NODES:
+            depth += 1
+        size = max(1, CHUNK_NODES // comp**depth)
+        indexes = list(range(comp))
+        for coords, angles in self.iter_chunks(age-depth):
+            for start in range(0, len(angles), size):
+                chunk = coords[2*start:2*(start+size)], angles[start:start+size]
+                for level in range(age-depth, age):
+                    chunk = self._step(chunk[0], chunk[1], level, self.tree.branches, indexes)
+                yield chunk
+
+    def _step(self, coords, angles, level, branches, indexes):
+        """Compute the children of nodes, as PythonEngine.step does without sigma."""
+        children = [(branch[1], self.lengths[level+1][i]) for branch, i in zip(branches, indexes)]
+        new_coords = []
+        new_angles = []
+        add_coord, add_angle = new_coords.append, new_angles.append
+        for n, angle in enumerate(angles):
+            x, y = coords[2*n], coords[2*n+1]
+            for branch_angle, length in children:
+                tot_angle = angle - branch_angle
+                add_coord(cos(-tot_angle)*length+x)
+                add_coord(sin(-tot_angle)*length+y)
+                add_angle(tot_angle)
+        return new_coords, new_angles
+
+class Level(object):
+    """A array like view of the coordinates or the angles of an age, computed when read.
+
+    Iterating computes the age chunk by chunk, indexing computes a single node
+    from the root down.
+
+    Attributes:
+        instances (object): The Instances of the tree.
+        age (int): The age.
+        item (int): 0 for the coordinates, 1 for the angles.
+    """
+    def __init__(self, instances, age, item):
+        self.instances = instances
+        self.age = age
+        self.item = item
+
+    def __len__(self):
+        return self.instances.tree.comp**self.age * (2 if self.item == 0 else 1)
+
+    def __iter__(self):
+        for chunk in self.instances.iter_chunks(self.age):
+            yield from chunk[self.item]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return array("d", islice(self, *index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("The age has no value {}.".format(index))
+        if self.item == 0:
+            return self.instances.get(self.age, index // 2)[index % 2]
+        return self.instances.get(self.age, index)[2]
+
+    def get_node(self, pos):
+        """Compute the coordinates of a single node of a age of coordinates.
+
+        Args:
+            pos (int): The position of the node in its age.
+
+        Returns:
+            tupel: The coordinates of the node. (x, y)
+        """
+        return self.instances.get(self.age, pos)[:2]
+
+    def iter_arrays(self):
+        """Iterate over the values chunk by chunk.
+
+        Yields:
+            array: The values of a chunk as doubles.
+        """
+        for chunk in self.instances.iter_chunks(self.age):
+            yield array("d", chunk[self.item])
@@ -0,0 +1,344 @@
+"""
+Module for drawing trees into numpy arrays, with antialiasing by the coverage of every pixel.
+"""
+from array import array
+from math import sqrt
+
+import numpy
+from PIL import Image
+
+from Tree.draw import Drawer
+
+# Maximum number of pixels tested at once, few enough for the temporary arrays to stay in the cpu cache
+CHUNK_PIXELS = 1 << 16
+
+class NumpyCanvas(object):
+    """A RGBA image held in a numpy array.
+
+    Without antialiasing, lines are stamped as discs along each line and the
+    pixels are set to the color. With antialiasing, the pixels around a line are
+    tested, and every pixel is covered by the part of the line within half a pixel
+    of its center, computed from the distance of the center to the line. Where
+    several lines of one call cover a pixel, the largest coverage counts, so the
+    joints are not darker. The coverage needs one byte per pixel during a call.
+
+    Attributes:
+        size (tupel): The size of the image. (width, height)
+        antialias (bool): Draws the edges with the coverage of the pixels, else sharp.
+        pixels (array): The pixels as uint8 array of the shape (height, width, 4).
+    """
+    def __init__(self, size, background=(0, 0, 0, 255), antialias=True):
+        """Constructor of the canvas.
+
+        Args:
+            size (tupel): The size of the image. (width, height)
+            background (tupel): The color of the image. (r, g, b, a)
+            antialias (bool): Draws the edges with the coverage of the pixels, else sharp.
+        """
+        self.size = size
+        self.antialias = antialias
+        self.pixels = numpy.empty((size[1], size[0], 4), dtype=numpy.uint8)
+        self.pixels[...] = _get_rgba(background)
+
+    def draw_lines(self, lines, color, width):
+        """Draw lines with round ends.
+
+        Args:
+            lines (array): The lines as float array of the shape (n, 4). [[x1, y1, x2, y2], ...]
+            color (tupel): The color of the lines. (r, g, b) or (r, g, b, a)
+            width (float): The width of the lines in pixels.
+        """
+        lines = numpy.asarray(lines, dtype=float).reshape(-1, 4)
+        if not len(lines):
+            return
+        if self.antialias:
+            self._draw_covered_lines(lines, color, width)
+        else:
+            self._draw_sharp_lines(lines, color, width)
+
+    def _draw_sharp_lines(self, lines, color, width):
+        """Stamp discs sqrt(radius) apart along the lines, their edges differ at most 1/8 pixel from a straight edge."""
+        radius = max(0.5, width/2)
+        offsets = _get_disc(radius)
+        spacing = max(1, sqrt(radius))
+        # Pixel centers are at whole coordinates, as in PIL
+        starts = lines[:, :2] + 0.5
+        deltas = lines[:, 2:] - lines[:, :2]
+        steps = numpy.ceil(numpy.hypot(deltas[:, 0], deltas[:, 1]) / spacing) + 1
+
+        rgba = _get_rgba(color)
+        pixels = self.pixels.reshape(-1).view(numpy.uint32)
+        # Transparent colors are blended once into every pixel, opaque ones set chunk by chunk
+        coverage = None if rgba[3] == 255 else _Coverage(len(pixels))
+        for group in _get_groups(steps):
+            group_starts, group_deltas = starts[group], deltas[group]
+            count = int(steps[group].max())
+            t = numpy.linspace(0, 1, count)[None, :, None]
+            size = max(1, CHUNK_PIXELS // (count*len(offsets)))
+            for first in range(0, len(group_starts), size):
+                centers = group_starts[first:first+size, None] + group_deltas[first:first+size, None] * t
+                centers = numpy.floor(centers.reshape(-1, 2)).astype(numpy.int64)
+                x = (centers[:, 0, None] + offsets[:, 0]).ravel()
+                y = (centers[:, 1, None] + offsets[:, 1]).ravel()
+                indexes = self._get_indexes(x, y)[0]
+                if coverage is None:
+                    pixels[indexes] = rgba.view(numpy.uint32)[0]
+                else:
+                    coverage.add(indexes, 255)
+        if coverage is not None:
+            self._blend_coverage(coverage, color)
+
+    def _draw_covered_lines(self, lines, color, width):
+        """Cover the pixels around the lines, walked along their major axis u, which is y for steep lines."""
+        radius = width/2
+        # Pixels up to half a pixel beyond the edge are covered
+        reach = radius + 0.5
+        lines = lines.T.astype(numpy.float32)
+        steep = numpy.abs(lines[3]-lines[1]) > numpy.abs(lines[2]-lines[0])
+
+        coverage = _Coverage(self.size[0]*self.size[1])
+        for flip in (False, True):
+            part = lines[:, steep == flip]
+            u1, v1, u2, v2 = part[[1, 0, 3, 2]] if flip else part
+            back = u2 < u1
+            u1, u2 = numpy.minimum(u1, u2), numpy.maximum(u1, u2)
+            v1, v2 = numpy.where(back, v2, v1), numpy.where(back, v1, v2)
+            first = numpy.ceil(u1-reach)
+            columns = numpy.floor(u2+reach) - first + 1
+            part = numpy.stack([u1, v1, u2, v2, first])
+            for group in _get_groups(columns):
+                group_lines = part[:, group]
+                count = int(columns[group].max())
+                # Lines at 45 degrees have the most rows in a column, 2*reach*sqrt(2)+1
+                size = max(1, CHUNK_PIXELS // (count*int(2.83*reach+1)))
+                for start in range(0, group_lines.shape[1], size):
+                    coverage.add(*self._cover_columns(group_lines[:, start:start+size], flip, count, radius, reach))
+        self._blend_coverage(coverage, color)
+
+    def _cover_columns(self, lines, flip, columns, radius, reach):
+        """Get the coverage of the pixels around lines, which are walked along their major axis u.
+
+        Args:
+            lines (array): The lines as float32 array of the shape (5, n). [u1, v1, u2, v2, first column]
+            flip (bool): The lines are steep, so u is y and v is x.
+            columns (int): The number of columns tested for every line.
+
+        Returns:
+            tupel: The flat indexes of the covered pixels and their coverage as uint8 array.
+        """
+        # The lines are the last axis, so numpy runs over all lines in every step
+        u1, v1, u2, v2, first = lines
+        du, dv = u2-u1, v2-v1
+        slope = dv / numpy.where(du > 0, du, 1)
+        # The half height of the pixels covered in a column
+        half = reach*numpy.sqrt(1+slope*slope)
+        rows = int(2*half.max()) + 1
+
+        # The coordinates relative to the start of the line, beyond the ends the columns stay at the ends
+        column = first + numpy.arange(columns, dtype=numpy.float32)[:, None]
+        pu = column - u1
+        top = numpy.ceil(v1 + slope*numpy.minimum(numpy.maximum(pu, 0), du) - half)
+        pv = (top - v1) + numpy.arange(rows, dtype=numpy.float32)[:, None, None]
+
+        # The squared distance to the closest point of the line, at t between its ends
+        length = du*du + dv*dv
+        scale = 1 / numpy.where(length > 0, length, 1)
+        t = pv * (dv*scale)
+        t += pu*(du*scale)
+        numpy.clip(t, 0, 1, out=t)
+        dy = pv - t*dv
+        t *= du
+        distance = pu - t
+        distance *= distance
+        dy *= dy
+        distance += dy
+        hits = numpy.flatnonzero(distance < reach*reach)
+        row, cell = numpy.divmod(hits, column.size)
+
+        # A pixel is covered by the part within half a pixel of its center, thin lines only partly
+        covered = numpy.sqrt(distance.ravel()[hits])
+        covered *= -255
+        covered += (radius+0.5)*255 + 0.5
+        numpy.minimum(covered, min(2*radius, 1)*255 + 0.5, out=covered)
+        u = column.ravel()[cell].astype(numpy.int64)
+        v = top.ravel()[cell].astype(numpy.int64) + row
+        return self._get_indexes(*((v, u) if flip else (u, v)), covered.astype(numpy.uint8))
+
+    def draw_circles(self, centers, color, radius):
+        """Draw filled circles.
+
+        Args:
+            centers (array): The centers as float array of the shape (n, 2). [[x, y], ...]
+            color (tupel): The color of the circles. (r, g, b) or (r, g, b, a)
+            radius (float): The radius of the circles in pixels.
+        """
+        centers = numpy.asarray(centers, dtype=float).reshape(-1, 2)
+        if not len(centers):
+            return
+        size = int(numpy.ceil(radius)) + 2
+        offsets = numpy.arange(-size, size+1)
+        count = max(1, CHUNK_PIXELS // len(offsets)**2)
+
+        coverage = _Coverage(self.size[0]*self.size[1])
+        for first in range(0, len(centers), count):
+            part = centers[first:first+count]
+            x = numpy.round(part[:, 0])[:, None, None] + offsets[None, :, None]
+            y = numpy.round(part[:, 1])[:, None, None] + offsets[None, None, :]
+            x, y = numpy.broadcast_arrays(x, y)
+            distance = numpy.hypot(x-part[:, 0, None, None], y-part[:, 1, None, None])
+            if self.antialias:
+                covered = numpy.clip(numpy.minimum(radius+0.5-distance, 2*radius), 0, 1)
+            else:
+                covered = (distance <= max(radius, 0.5)).astype(float)
+            inside = covered > 0
+            coverage.add(*self._get_indexes(x[inside].astype(numpy.int64), y[inside].astype(numpy.int64),
+                                            numpy.rint(covered[inside]*255).astype(numpy.uint8)))
+        self._blend_coverage(coverage, color)
+
+    def _get_indexes(self, x, y, coverage=None):
+        """Get the flat indexes of the pixels inside the image.
+
+        Returns:
+            tupel: The flat indexes and the coverage of the pixels, if given.
+        """
+        width, height = self.size
+        # Negative coordinates are larger than any size as unsigned integers
+        inside = (x.view(numpy.uint64) < width) & (y.view(numpy.uint64) < height)
+        return y[inside]*width + x[inside], None if coverage is None else coverage[inside]
+
+    def _blend_coverage(self, coverage, color):
+        """Blend a color into the covered pixels, each once with its largest coverage."""
+        indexes = coverage.get_covered()
+        rgba = _get_rgba(color)
+        self._blend(indexes, coverage.values[indexes] * numpy.float32(rgba[3]/255/255), rgba)
+
+    def _blend(self, indexes, weight, rgba):
+        """Blend a color into pixels, with the weight of every pixel between 0 and 1."""
+        rgba = rgba.astype(numpy.float32)
+        rgba[3] = 255
+        pixels = self.pixels.reshape(-1).view(numpy.uint32)
+        old = pixels[indexes].view(numpy.uint8).reshape(-1, 4).astype(numpy.float32)
+        pixels[indexes] = numpy.rint(old + (rgba-old)*weight[:, None]).astype(numpy.uint8).view(numpy.uint32).ravel()
+
+    def to_array(self):
+        """Get the image.
+
+        Returns:
+            array: The image as uint8 array of the shape (height, width, 4).
+        """
+        return self.pixels.copy()
+
+    def to_image(self, mode="RGBA"):
+        """Get the image as PIL image, e.g. for saving it.
+
+        Args:
+            mode (string): The mode of the PIL image, e.g. RGB.
+
+        Returns:
+            object: The PIL image.
+        """
+        image = Image.fromarray(self.pixels, "RGBA")
+        return image if mode == "RGBA" else image.convert(mode)
+
+class _Coverage(object):
+    """The largest coverage of every pixel during a draw call, with one byte per pixel.
+
+    Attributes:
+        values (array): The coverage of every pixel as uint8 array, 255 for fully covered.
+        parts (list): Holding the flat indexes of the covered pixels, as long as sorting them
+            is faster than scanning all pixels. Else None.
+        count (int): The number of indexes added to the parts.
+    """
+    def __init__(self, pixels):
+        self.values = numpy.zeros(pixels, dtype=numpy.uint8)
+        self.parts = []
+        self.count = 0
+
+    def add(self, indexes, covered):
+        """Add the coverage of pixels, a pixel can be given several times."""
+        numpy.maximum.at(self.values, indexes, covered)
+        if self.parts is not None:
+            self.parts.append(indexes)
+            self.count += len(indexes)
+            if self.count > len(self.values) // 256:
+                self.parts = None
+
+    def get_covered(self):
+        """Get the flat indexes of the covered pixels, each once.
+
+        Returns:
+            array: The indexes.
+        """
+        if self.parts is None:
+            return self.values.view(bool).nonzero()[0]
+        return numpy.unique(numpy.concatenate(self.parts)) if self.parts else numpy.empty(0, dtype=numpy.int64)
+
+class NumpyDrawer(Drawer):
+    """A drawer class for drawing on a NumpyCanvas.
+
+    All branches of an age are drawn at once by numpy. Without viewport, the
+    branches are taken straight from the node arrays of the tree, unless it is
+    instanced. The thickness is not rounded to whole pixels, because with
+    antialiasing thin lines still show.
+    """
+    def _get_thickness(self, age):
+        return (self.thickness*5)/(age+5)
+
+    def _draw_age(self, branches, color, thickness, age):
+        tree = self.tree
+        stored = age > 0 and _is_buffer(tree.nodes[age-1]) and _is_buffer(tree.nodes[age])
+        if self.viewport is not None or not stored:
+            lines = numpy.fromiter((coord for branch in branches for coord in branch), dtype=float).reshape(-1, 4)
+        else:
+            # The same branches as iter_age_branches gives, without a tupel for each
+            parents = numpy.frombuffer(tree.nodes[age-1], dtype=float).reshape(-1, 2)
+            nodes = numpy.frombuffer(tree.nodes[age], dtype=float).reshape(-1, 2)
+            lines = numpy.empty((len(nodes), 4))
+            lines[:, :2] = numpy.repeat(parents, tree.comp, axis=0)
+            lines[:, 2:] = nodes
+            lines += tree.offset * 2
+        self.canvas.draw_lines(lines, color, thickness)
+
+    def _draw_fill(self, nodes, color, radius):
+        centers = numpy.fromiter((coord for node in nodes for coord in node), dtype=float).reshape(-1, 2)
+        self.canvas.draw_circles(centers, color, radius)
+
+def _get_groups(sizes):
+    """Group lines, whose sizes differ at most by a factor of 2, so every chunk is as large as its lines need.
+
+    Args:
+        sizes (array): The size of every line, at least 1.
+
+    Returns:
+        list: The indexes of the lines of every group, or a slice of all lines.
+    """
+    if not len(sizes):
+        return []
+    levels = numpy.log2(sizes).astype(numpy.int64)
+    if levels.min() == levels.max():
+        return [slice(None)]
+    return [indexes for indexes in (numpy.flatnonzero(levels == level) for level in range(levels.min(), levels.max()+1))
+            if len(indexes)]
+
+def _is_buffer(values):
+    """Check, if values are stored as doubles, which numpy can use without copying."""
+    return isinstance(values, (array, memoryview))
+
+def _get_rgba(color):
+    """Get a color as uint8 array with alpha.
+
+    Returns:
+        array: (r, g, b, a)
+    """
+    return numpy.array(tuple(color) + (255,)*(4-len(color)), dtype=numpy.uint8)
+
+def _get_disc(radius):
+    """Get the offsets of all pixels within a radius around a pixel.
+
+    Returns:
+        array: The offsets as int64 array of the shape (n, 2).
+    """
+    size = int(radius)
+    ys, xs = numpy.mgrid[-size:size+1, -size:size+1]
+    inside = xs*xs + ys*ys <= radius*radius
+    return numpy.stack([xs[inside], ys[inside]], axis=1).astype(numpy.int64)
@@ -0,0 +1,325 @@
+"""
+Module for a local server rendering trees, which keeps recent results in a cache.
+
+Trees are requested with GET /render and the options as query, e.g.
+/render?age=8&branch=0.5,45&branch=0.5,-45&sigma=0.1,0.1&seed=3&format=png
+"""
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
+from math import radians
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from Tree.core import Tree, BudgetError
+from Tree.draw import SvgStreamDrawer
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "svg": "image/svg+xml"
+}
+# The options, which describe a grown tree
+TREE_OPTIONS = ("length", "branches", "sigma", "seed", "age")
+# Number of grown trees kept by every worker process
+WORKER_TREES = 8
+# Maximum number of bytes the tree and the image of a request may need by default
+MAX_BYTES = 256 * 2**20
+
+class LRUCache(object):
+    """A cache, which forgets the least recently used entries.
+
+    Attributes:
+        size (int): The maximum number of entries.
+        entries (OrderedDict): The entries, the least recently used first.
+        hits (int): The number of entries found.
+        misses (int): The number of entries not found.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get a entry and mark it as used.
+
+        Returns:
+            object: The value of the entry or None, if there is no entry.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        """Add a entry and forget the least recently used ones above the size."""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+# The grown trees of a worker process
+_trees = LRUCache(WORKER_TREES)
+
+def _parse_numbers(value, count, kind=float):
+    numbers = tuple(kind(number) for number in value.split(","))
+    if len(numbers) not in count:
+        raise ValueError("Expected {} numbers, but got {}.".format(" or ".join(map(str, count)), value))
+    return numbers
+
+def parse_options(query):
+    """Read the render options from a query string.
+
+    Missing options have the defaults of the cli. Options describing the same
+    image give the same result, no matter how they are written, so it can be used
+    as key for caches.
+
+    Args:
+        query (string): e.g. age=8&branch=0.5,45&branch=0.5,-45&stem_color=255,0,255&format=svg
+
+    Returns:
+        tupel: The sorted options as (name, value) pairs.
+
+    Raises:
+        ValueError: If a option is unknown or invalid.
+    """
+    values = parse_qs(query, strict_parsing=bool(query))
+    last = lambda name, default: values.pop(name, [default])[-1]
+    seed = last("seed", None)
+
+    options = {
+        "length": float(last("length", 300)),
+        "branches": tuple(_parse_numbers(branch, (2,)) for branch in values.pop("branch", ["0.5,45", "0.5,-45"])),
+        "sigma": _parse_numbers(last("sigma", "0,0"), (2,)),
+        "seed": None if seed is None else int(seed),
+        "age": int(last("age", 5)),
+        "stem_color": _parse_numbers(last("stem_color", "255,0,255"), (3, 6), int),
+        "leaf_color": _parse_numbers(last("leaf_color", "255,255,255"), (3,), int),
+        "thickness": int(last("thickness", 5)),
+        "format": last("format", "png").lower()
+    }
+    if options["format"] not in CONTENT_TYPES:
+        raise ValueError("Unsupported format {}.".format(options["format"]))
+    if values:
+        raise ValueError("Unknown options: {}.".format(", ".join(sorted(values))))
+    return tuple(sorted(options.items()))
+
+def is_cacheable(options):
+    """Check, if the same options always give the same image, which is not the case for sigma without seed."""
+    options = dict(options)
+    return options["seed"] is not None or options["sigma"] == (0, 0)
+
+def _make_tree(options, max_nodes, max_bytes):
+    """Make the tree described by the options, without growing it."""
+    branches = [[scale, radians(angle)] for scale, angle in options["branches"]]
+    return Tree((0, 0, 0, -options["length"]), branches, options["sigma"], seed=options["seed"],
+                max_nodes=max_nodes, max_bytes=max_bytes)
+
+def check_budget(options, max_nodes=None, max_bytes=None):
+    """Check, if a tree can be rendered without exceeding the budget, before anything is grown.
+
+    Args:
+        options (tupel): The options given by parse_options.
+        max_nodes (int): The maximum number of nodes a tree may have.
+        max_bytes (int): The maximum number of bytes the tree and the image may need.
+
+    Raises:
+        BudgetError: If the tree would have too many nodes or need too much memory.
+    """
+    options = dict(options)
+    tree = _make_tree(options, max_nodes, max_bytes)
+    tree.check_budget(options["age"])
+    costs = tree.estimate(options["age"])
+    needed = costs["node_bytes"] + costs["svg_bytes" if options["format"] == "svg" else "raster_bytes"]
+    if max_bytes is not None and needed > max_bytes:
+        raise BudgetError("The tree needs about {} bytes, but only {} are allowed.".format(needed, max_bytes))
+
+def render(options, max_nodes=None, max_bytes=None):
+    """Render a tree in a worker process.
+
+    The grown trees are kept in a cache of the worker, so the same tree in
+    another color or format is not grown again.
+
+    Args:
+        options (tupel): The options given by parse_options.
+        max_nodes (int): The maximum number of nodes a tree may have.
+        max_bytes (int): The maximum number of bytes the nodes of a tree may need.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    cacheable = is_cacheable(options)
+    options = dict(options)
+    key = tuple(options[name] for name in TREE_OPTIONS)
+    tree = _trees.get(key) if cacheable else None
+    if tree is None:
+        tree = _make_tree(options, max_nodes, max_bytes)
+        tree.grow(options["age"])
+        tree.move_in_rectangle()
+        if cacheable:
+            _trees.put(key, tree)
+
+    style = (options["stem_color"], options["leaf_color"], options["thickness"])
+    if options["format"] == "svg":
+        svg = StringIO()
+        SvgStreamDrawer(tree, svg, *style).draw()
+        return svg.getvalue().encode()
+
+    im = Image.new("RGB", tree.get_size())
+    tree.draw_on(im, *style)
+    data = BytesIO()
+    im.save(data, format=options["format"].upper())
+    return data.getvalue()
+
+class RenderServer(object):
+    """A asyncio server rendering trees in worker processes.
+
+    Rendered images are kept in a cache. Requests for a image, which is being
+    rendered, wait for the same job. Images of trees with sigma but without seed
+    are rendered for every request. Requests exceeding the budget are refused
+    before anything is grown. If a worker dies, e.g. killed for its memory,
+    the pool is started again.
+
+    Attributes:
+        cache (object): The LRUCache of the encoded images.
+        max_nodes (int): The maximum number of nodes a tree may have.
+        max_bytes (int): The maximum number of bytes a tree and its image may need.
+        workers (int): The number of worker processes.
+        pool (object): The pool of worker processes.
+        pending (dict): Holding the future of every job running.
+    """
+    def __init__(self, workers=None, cache_size=64, max_nodes=None, max_bytes=MAX_BYTES):
+        """Constructor of the server.
+
+        Args:
+            workers (int): The number of worker processes. Defaults to the number of cpus.
+            cache_size (int): The number of images kept in the cache.
+            max_nodes (int): The maximum number of nodes a tree may have.
+            max_bytes (int): The maximum number of bytes a tree and its image may need. None for no limit.
+        """
+        self.cache = LRUCache(cache_size)
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.pool = self._start_pool()
+        self.pending = {}
+
+    def _start_pool(self):
+        # Forked workers would inherit the sockets of the server and keep connections open
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    async def _run(self, options):
+        """Render a image in the pool, which is started again once, if it is broken."""
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            return await loop.run_in_executor(pool, render, options, self.max_nodes, self.max_bytes)
+        except BrokenProcessPool:
+            if self.pool is pool:
+                pool.shutdown(wait=False)
+                self.pool = self._start_pool()
+            return await loop.run_in_executor(self.pool, render, options, self.max_nodes, self.max_bytes)
+
+    async def render(self, options):
+        """Get a rendered image from the cache or render it.
+
+        Args:
+            options (tupel): The options given by parse_options.
+
+        Returns:
+            tupel: The encoded image and True, if it was found in the cache.
+
+        Raises:
+            BudgetError: If the tree would exceed the budget.
+            BrokenProcessPool: If the pool broke again, after it was started again.
+        """
+        if not is_cacheable(options):
+            check_budget(options, self.max_nodes, self.max_bytes)
+            return await self._run(options), False
+
+        data = self.cache.get(options)
+        if data is not None:
+            return data, True
+
+        if options not in self.pending:
+            check_budget(options, self.max_nodes, self.max_bytes)
+            self.pending[options] = asyncio.ensure_future(self._run(options))
+        future = self.pending[options]
+        try:
+            data = await future
+        finally:
+            if self.pending.get(options) is future:
+                del self.pending[options]
+        self.cache.put(options, data)
+        return data, False
+
+    async def handle(self, reader, writer):
+        """Answer a http request."""
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            if len(request) < 2 or request[0] != "GET":
+                await self._respond(writer, 405, b"Only GET is supported.\n")
+                return
+            url = urlsplit(request[1])
+            if url.path != "/render":
+                await self._respond(writer, 404, b"Use /render.\n")
+                return
+
+            try:
+                options = parse_options(url.query)
+                data, hit = await self.render(options)
+            except (ValueError, BudgetError) as error:
+                await self._respond(writer, 400, (str(error) + "\n").encode())
+                return
+            except BrokenProcessPool:
+                await self._respond(writer, 503, b"The workers failed, try again later.\n")
+                return
+            except Exception as error:
+                await self._respond(writer, 500, ((str(error) or repr(error)) + "\n").encode())
+                return
+
+            content_type = CONTENT_TYPES[dict(options)["format"]]
+            await self._respond(writer, 200, data, content_type, {"X-Cache": "hit" if hit else "miss"})
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, content_type="text/plain", headers=None):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        lines = ["HTTP/1.1 {} {}".format(status, reasons[status]), "Content-Type: " + content_type,
+                 "Content-Length: {}".format(len(body)), "Connection: close"]
+        lines += ["{}: {}".format(name, value) for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080, path=None):
+        """Serve until the task is cancelled.
+
+        Args:
+            host (string): The host to listen on.
+            port (int): The port to listen on.
+            path (string): If given, the path of a unix socket to listen on instead.
+        """
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown()
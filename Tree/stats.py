@@ -0,0 +1,54 @@
+"""
+Module for measuring, where the time of growing and drawing trees goes.
+"""
+import time
+from contextlib import contextmanager
+
+class Stats(object):
+    """Timers and counters for the phases of growing, drawing and saving a tree.
+
+    A tree and its drawers share one stats object. Phases can be nested, e.g.
+    saving tiles contains drawing them, so the times do not have to add up.
+
+    Attributes:
+        times (dict): Holding the seconds spent in every phase.
+        counts (dict): Holding counters, e.g. nodes, segments and bytes.
+        callback (function): If given, called with the phase and its duration after every phase.
+    """
+    def __init__(self, callback=None):
+        self.times = {}
+        self.counts = {}
+        self.callback = callback
+
+    @contextmanager
+    def timer(self, phase):
+        """Measure the time of a phase and add it to the time of the phase.
+
+        Args:
+            phase (string): The name of the phase, e.g. grow.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.times[phase] = self.times.get(phase, 0) + duration
+            if self.callback is not None:
+                self.callback(phase, duration)
+
+    def count(self, name, value=1):
+        """Increase a counter.
+
+        Args:
+            name (string): The name of the counter, e.g. nodes.
+            value (int): The value added to the counter.
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def as_dict(self):
+        """Get the times and counters, e.g. for dumping them as json.
+
+        Returns:
+            dict: {"times": {...}, "counts": {...}}
+        """
+        return {"times": dict(self.times), "counts": dict(self.counts)}
@@ -0,0 +1,123 @@
+"""
+Module for saving grown trees and loading them without growing them again.
+
+A tree file starts with a header, followed by the nodes and the angles of every age
+as raw doubles. The header holds the parameters of the tree as json:
+
+    magic (4 bytes) | version (uint32) | header length (uint32) | json | padding
+    nodes of age 0 | angles of age 0 | nodes of age 1 | angles of age 1 | ...
+
+The padding aligns the data to 8 bytes, so the arrays can be used straight
+from a memory mapped file.
+"""
+import json
+import os
+import struct
+import sys
+from array import array
+from mmap import mmap, ACCESS_READ
+
+from Tree.core import Tree
+from Tree.engine import ENGINES
+
+MAGIC = b"TREE"
+VERSION = 1
+PREFIX = struct.Struct("<4sII")
+
+def dump_tree(tree, path):
+    """Save a grown tree.
+
+    The tree is written into a temporary file next to the path, which then replaces
+    the file at the path. So a tree memory mapped from the path can be saved back
+    to it, its mapping keeps the old file until it is closed.
+
+    Args:
+        tree (object): The tree, which should be saved.
+        path (string): The path of the tree file.
+    """
+    engines = {engine: name for name, engine in ENGINES.items()}
+    header = json.dumps({
+        "pos": list(tree.pos),
+        "length": tree.length,
+        "branches": [list(branch) for branch in tree.branches],
+        "sigma": list(tree.sigma),
+        "seed": tree.seed,
+        "engine": engines.get(type(tree.engine), "python"),
+        "age": tree.age,
+        "offset": list(tree.offset),
+        "rectangles": [list(rec) for rec in tree.rectangles],
+        "counts": [len(angles) for angles in tree.angles],
+        "byteorder": sys.byteorder
+    }).encode()
+    header += b" " * (-(PREFIX.size+len(header)) % 8)
+
+    folder, name = os.path.split(os.path.abspath(path))
+    temp = os.path.join(folder, ".{}.{}.tmp".format(name, os.getpid()))
+    f = open(temp, "xb")
+    try:
+        with f:
+            f.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+            f.write(header)
+            for nodes, angles in zip(tree.nodes, tree.angles):
+                for values in (nodes, angles):
+                    # The ages of instanced trees are computed chunk by chunk
+                    for chunk in values.iter_arrays() if hasattr(values, "iter_arrays") else [values]:
+                        f.write(memoryview(chunk).cast("B"))
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+def load_tree(path, memory_map=True):
+    """Load a saved tree.
+
+    With memory_map, the nodes and angles are memoryviews of the mapped file,
+    so nothing is read before it is used and the tree shares the memory with
+    the page cache. Else they are read into arrays. Files written on a machine
+    with another byte order are always read into arrays.
+    The random generator starts again from the seed, so a tree grown further
+    with sigma does not continue like the saved tree would have.
+
+    Args:
+        path (string): The path of the tree file.
+        memory_map (bool): Maps the file into the memory instead of reading it.
+
+    Returns:
+        object: The loaded tree.
+
+    Raises:
+        ValueError: If the file is no tree file of a supported version.
+    """
+    with open(path, "rb") as f:
+        magic, version, size = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is no tree file of version {}.".format(path, VERSION))
+        header = json.loads(f.read(size).decode())
+
+        swap = header["byteorder"] != sys.byteorder
+        if memory_map and not swap:
+            data = memoryview(mmap(f.fileno(), 0, access=ACCESS_READ))
+        else:
+            data = memoryview(f.read())
+            memory_map = False
+        # The mapped file starts with the header, the read data after it
+        start = PREFIX.size+size if memory_map else 0
+
+    tree = Tree(tuple(header["pos"]), header["branches"], header["sigma"], header["engine"], seed=header["seed"])
+    tree.length = header["length"]
+    tree.nodes, tree.angles = [], []
+    for count in header["counts"]:
+        for arrays, length in ((tree.nodes, 2*count), (tree.angles, count)):
+            end = start + 8*length
+            if memory_map:
+                arrays.append(data[start:end].cast("d"))
+            else:
+                arrays.append(array("d", data[start:end].tobytes()))
+                if swap:
+                    arrays[-1].byteswap()
+            start = end
+
+    tree.age = header["age"]
+    tree.offset = tuple(header["offset"])
+    tree.rectangles = [tuple(rec) for rec in header["rectangles"]]
+    return tree
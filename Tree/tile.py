@@ -0,0 +1,126 @@
+"""
+Module for drawing trees on tiles, for images too large for the memory.
+"""
+import struct
+import zlib
+
+from PIL import Image
+
+from Tree.draw import PilDrawer
+
+def get_tiles(size, tile_size):
+    """Split an image into tiles.
+
+    Args:
+        size (tupel): The size of the whole image. (width, height)
+        tile_size (tupel): The maximum size of a tile. (width, height)
+
+    Returns:
+        list: Holding the row, the column and the rectangle of every tile.
+            [(row, column, (x1, y1, x2, y2)), ...]
+    """
+    tiles = []
+    for row, y in enumerate(range(0, size[1], tile_size[1])):
+        for column, x in enumerate(range(0, size[0], tile_size[0])):
+            tiles.append((row, column, (x, y, min(x+tile_size[0], size[0]), min(y+tile_size[1], size[1]))))
+    return tiles
+
+def draw_tile(tree, rectangle, stem_color, leaf_color, thickness, background=(0, 0, 0), **kwargs):
+    """Draw the part of the tree inside a rectangle on a new image.
+
+    Only branches crossing the tile are drawn. The tile is drawn with a margin,
+    because PIL draws thick lines differently at the border of an image.
+    The drawer rounds the coordinates of a viewport down like PIL does on a single image,
+    so the tiles put together are equal to drawing the tree on a single image.
+
+    Args:
+        tree (object): The tree, which should be drawn.
+        rectangle (tupel): The rectangle of the tile in image coordinates. (x1, y1, x2, y2)
+        stem_color (tupel): Color or gradient for the stem of the tree.
+        leaf_color (tupel): Color for the leaf (= the color for last iteration).
+        thickness (int): The start thickness of the tree.
+        background (tupel): The color of the image.
+        **kwargs: Further options for PilDrawer, e.g. min_length.
+
+    Returns:
+        object: The PIL image of the tile.
+    """
+    margin = thickness+2
+    x1, y1, x2, y2 = rectangle[0]-margin, rectangle[1]-margin, rectangle[2]+margin, rectangle[3]+margin
+    canvas = Image.new("RGB", (x2-x1, y2-y1), background)
+    PilDrawer(tree, canvas, stem_color, leaf_color, thickness, viewport=(x1, y1, x2, y2), **kwargs).draw()
+    return canvas.crop((margin, margin, x2-x1-margin, y2-y1-margin))
+
+def save_tiles(tree, path, size, tile_size, stem_color, leaf_color, thickness, background=(0, 0, 0), **kwargs):
+    """Draw the tree tile by tile and save every tile as own image.
+
+    Args:
+        tree (object): The tree, which should be drawn.
+        path (string): The path of the tiles, containing {row} and {column}. e.g. tree_{row}_{column}.png
+        size (tupel): The size of the whole image. (width, height)
+        tile_size (tupel): The maximum size of a tile. (width, height)
+
+    Returns:
+        list: The paths of the saved tiles.
+    """
+    paths = []
+    for row, column, rectangle in get_tiles(size, tile_size):
+        paths.append(path.format(row=row, column=column))
+        draw_tile(tree, rectangle, stem_color, leaf_color, thickness, background, **kwargs).save(paths[-1])
+    return paths
+
+def save_png(tree, path, size, strip_height, stem_color, leaf_color, thickness, background=(0, 0, 0), **kwargs):
+    """Draw the tree strip by strip into a single png file.
+
+    Only one strip of the image is in the memory at once.
+
+    Args:
+        tree (object): The tree, which should be drawn.
+        path (string): The path of the png file.
+        size (tupel): The size of the whole image. (width, height)
+        strip_height (int): The height of the strips drawn at once.
+    """
+    with open(path, "wb") as f:
+        writer = PngWriter(f, size)
+        for _, _, rectangle in get_tiles(size, (size[0], strip_height)):
+            writer.write(draw_tile(tree, rectangle, stem_color, leaf_color, thickness, background, **kwargs))
+        writer.close()
+
+class PngWriter(object):
+    """A writer for RGB png files, which are written row by row.
+
+    Attributes:
+        file (object): The file opened for writing bytes.
+        size (tupel): The size of the image. (width, height)
+    """
+    def __init__(self, file, size):
+        self.file = file
+        self.size = size
+        self._compressor = zlib.compressobj()
+
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bit depth, truecolor, no interlace
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", size[0], size[1], 8, 2, 0, 0, 0))
+
+    def write(self, image):
+        """Append rows to the image.
+
+        Args:
+            image (object): A RGB PIL image with the width of the png.
+        """
+        data = image.tobytes()
+        stride = self.size[0]*3
+        # Every row starts with the filter type, 0 for none
+        rows = b"".join(b"\0" + data[i:i+stride] for i in range(0, len(data), stride))
+        self._write_chunk(b"IDAT", self._compressor.compress(rows))
+
+    def close(self):
+        """Finish the png file."""
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+
+    def _write_chunk(self, kind, data):
+        if kind == b"IDAT" and not data:
+            return
+        self.file.write(struct.pack(">I", len(data)) + kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
@@ -14,6 +14,29 @@ def convert_color(color):
     """
     return "rgb({}, {}, {})".format(color[0], color[1], color[2])
 
+def get_bounds(coords):
+    """Get the rectangle around coordinates, which are stored one after another.
+
+    Args:
+        coords (array): The coordinates. [x1, y1, x2, y2, ...]
+
+    Returns:
+        tupel: (x1, y1, x2, y2)
+    """
+    return (min(coords[0::2]), min(coords[1::2]), max(coords[0::2]), max(coords[1::2]))
+
+def unite_rectangles(rectangles):
+    """Get the rectangle around several rectangles.
+
+    Args:
+        rectangles (list): The rectangles. [(x1, y1, x2, y2), ...]
+
+    Returns:
+        tupel: (x1, y1, x2, y2)
+    """
+    return (min(rec[0] for rec in rectangles), min(rec[1] for rec in rectangles),
+            max(rec[2] for rec in rectangles), max(rec[3] for rec in rectangles))
+
 class Node(object):
     """A node.
 
@@ -0,0 +1,183 @@
+"""
+Benchmark suite for growing, querying and drawing trees.
+
+Runs every case for a matrix of branch counts, ages and sigmas and reports
+the best time, the peak memory and the nodes per second. Results can be saved
+as baseline and later runs compared against it. The peak memory is traced by
+tracemalloc, which does not see the pixels Pillow allocates in C, so the size
+of the image is added for draw/pil.
+
+    python benchmarks/bench.py --save               # store the baseline
+    python benchmarks/bench.py --compare            # fail on regressions
+    python benchmarks/bench.py --quick --save       # the same for the small trees
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from importlib.util import find_spec
+from math import radians
+
+from PIL import Image
+import svgwrite
+
+from Tree.core import Tree, generate_branches
+from Tree.draw import PilDrawer, SvgDrawer, SvgStreamDrawer
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Number of branches and the ages grown with them
+MATRIX = {
+    2: (10, 14),
+    3: (6, 9)
+}
+QUICK_MATRIX = {
+    2: (8,),
+    3: (5,)
+}
+SIGMAS = (0, 0.1)
+# Benchmarks faster than this in the baseline are too noisy to compare
+MIN_TIME = 1e-3
+# Bytes of a pixel of a RGB image in Pillow, which stores them as 4 bytes
+PIL_PIXEL_BYTES = 4
+
+def make_tree(comp, age, sigma, engine="python"):
+    """Make a grown tree, which fits into its rectangle."""
+    branches = generate_branches([0.6]*comp, [radians(80/comp)]*comp)
+    tree = Tree((0, 0, 0, -300), branches, (sigma, sigma), engine=engine, seed=0)
+    tree.grow(age)
+    tree.move_in_rectangle()
+    return tree
+
+def get_cases(comp, age, sigma):
+    """Get the benchmarks for one entry of the matrix.
+
+    Returns:
+        tupel: The number of nodes, a dict holding a function, which returns the function
+            to measure, for every case and a dict holding the bytes allocated outside of
+            python by a case.
+    """
+    tree = make_tree(comp, age, sigma)
+    engines = ["python"] + (["numpy"] if find_spec("numpy") is not None else [])
+    cases = {}
+
+    for engine in engines:
+        cases["grow/" + engine] = lambda engine=engine: lambda: make_tree(comp, age, sigma, engine)
+    cases["get_nodes"] = lambda: tree.get_nodes
+    cases["get_branches"] = lambda: tree.get_branches
+    cases["get_rectangle"] = lambda: tree.get_rectangle
+    cases["move"] = lambda: lambda: tree.move((1, 1))
+    cases["draw/pil"] = lambda: lambda: PilDrawer(tree, Image.new("RGB", tree.get_size())).draw()
+    cases["draw/svg"] = lambda: lambda: SvgDrawer(tree, svgwrite.Drawing()).draw()
+    cases["draw/svg_stream"] = lambda: lambda: SvgStreamDrawer(tree, io.StringIO()).draw()
+    width, height = tree.get_size()
+    untraced = {"draw/pil": width * height * PIL_PIXEL_BYTES}
+    return tree.get_node_sum(), cases, untraced
+
+def measure(func, repeat, untraced=0):
+    """Measure the best time of several runs and the peak memory of a extra run.
+
+    Args:
+        untraced (int): The bytes allocated outside of python, which are added to the peak.
+
+    Returns:
+        tupel: The time in seconds and the peak memory in bytes.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak + untraced
+
+def run(matrix, repeat, only=None):
+    """Run all benchmarks.
+
+    Returns:
+        dict: Holding time, peak memory and nodes per second for every benchmark.
+    """
+    results = {}
+    for comp, ages in sorted(matrix.items()):
+        for age in ages:
+            for sigma in SIGMAS:
+                nodes, cases, untraced = get_cases(comp, age, sigma)
+                for case, make in cases.items():
+                    if only is not None and not case.startswith(only):
+                        continue
+                    name = "{}/b{}/a{}/s{}".format(case, comp, age, sigma)
+                    duration, peak = measure(make(), repeat, untraced.get(case, 0))
+                    results[name] = {
+                        "time": duration,
+                        "peak": peak,
+                        "nodes_per_second": nodes / duration if duration else None
+                    }
+                    print("{:40} {:10.4f}s {:10.1f}MB {:14.0f} nodes/s".format(
+                        name, duration, peak / 1e6, results[name]["nodes_per_second"] or 0))
+    return results
+
+def compare(results, baseline, tolerance):
+    """Compare results with a baseline.
+
+    Returns:
+        tupel: The names of the benchmarks, which are slower than tolerance times the baseline,
+            and the number of benchmarks found in the baseline.
+    """
+    slower = []
+    found = 0
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        found += 1
+        if baseline[name]["time"] < MIN_TIME:
+            continue
+        ratio = result["time"] / baseline[name]["time"]
+        mark = ""
+        if ratio > tolerance:
+            slower.append(name)
+            mark = "  REGRESSION"
+        print("{:40} {:6.2f}x{}".format(name, ratio, mark))
+    return slower, found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--quick", action="store_true", help="Use small trees only.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best counts.")
+    parser.add_argument("--only", default=None, help="Run only cases starting with this, e.g. draw.")
+    parser.add_argument("--save", action="store_true", help="Save the results as baseline.")
+    parser.add_argument("--compare", action="store_true", help="Compare the results with the baseline.")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown against the baseline.")
+    parser.add_argument("--baseline", default=BASELINE, help="The path of the baseline.")
+    args = parser.parse_args()
+
+    results = run(QUICK_MATRIX if args.quick else MATRIX, args.repeat, args.only)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.baseline) as f:
+            slower, found = compare(results, json.load(f), args.tolerance)
+        if not found:
+            print("None of the benchmarks is in the baseline {}, save it first.".format(args.baseline))
+            sys.exit(1)
+        if slower:
+            print("{} benchmarks are slower than {}x the baseline.".format(len(slower), args.tolerance))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
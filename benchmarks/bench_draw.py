@@ -0,0 +1,72 @@
+"""
+Benchmark for drawing trees on PIL images.
+
+Compares the segments per second of drawing every branch with its own
+ImageDraw.Draw (as PilDrawer did before) with the batched PilDrawer and,
+if numpy is installed, with the NumpyDrawer with sharp and with antialiased edges.
+
+    python benchmarks/bench_draw.py --age 16
+"""
+import argparse
+import time
+from functools import partial
+from importlib.util import find_spec
+from math import radians
+
+from PIL import Image, ImageDraw
+
+from Tree.core import Tree
+from Tree.draw import PilDrawer
+
+def draw_per_branch(tree, canvas, color=(255, 255, 255), thickness=1):
+    """Draw every branch with a new ImageDraw.Draw."""
+    for level in tree.get_branches():
+        for branch in level:
+            ImageDraw.Draw(canvas).line(branch, color, thickness)
+
+def draw_batched(tree, canvas, color=(255, 255, 255), thickness=1):
+    """Draw the branches with PilDrawer."""
+    PilDrawer(tree, canvas, color, color, thickness).draw()
+
+def draw_numpy(tree, canvas, color=(255, 255, 255), thickness=1, antialias=True):
+    """Draw the branches with NumpyDrawer and read the image, as it is done for saving."""
+    from Tree.raster import NumpyCanvas
+    canvas = NumpyCanvas(canvas.size, antialias=antialias)
+    tree.draw_on(canvas, color, color, thickness)
+    canvas.to_image("RGB")
+
+def measure(func, tree, repeat):
+    """Get the best segments per second of several runs."""
+    best = None
+    for _ in range(repeat):
+        canvas = Image.new("RGB", tree.get_size())
+        start = time.perf_counter()
+        func(tree, canvas)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return tree.get_node_sum() / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--age", type=int, default=14)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tree = Tree((0, 0, 0, -300), [[.6, radians(40)], [.6, radians(-40)]])
+    tree.grow(args.age)
+    tree.move_in_rectangle()
+
+    before = measure(draw_per_branch, tree, args.repeat)
+    after = measure(draw_batched, tree, args.repeat)
+    print("segments: {}".format(tree.get_node_sum()))
+    print("per branch: {:12.0f} segments/s".format(before))
+    print("batched:    {:12.0f} segments/s".format(after))
+    print("speedup:    {:12.1f}x".format(after / before))
+
+    if find_spec("numpy") is not None:
+        for antialias in (False, True):
+            numpy = measure(partial(draw_numpy, antialias=antialias), tree, args.repeat)
+            print("{:12}{:12.0f} segments/s  {:6.1f}x".format("numpy aa:" if antialias else "numpy:", numpy, numpy / before))
+
+if __name__ == "__main__":
+    main()
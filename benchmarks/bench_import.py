@@ -0,0 +1,55 @@
+"""
+Benchmark for the time of importing the modules of the package.
+
+Imports every module in a new interpreter and reports the best time of
+several runs and which drawing libraries were imported along with it.
+
+    python benchmarks/bench_import.py --repeat 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+MODULES = ("Tree.core", "Tree.draw", "Tree.tile", "Tree.cli")
+LIBRARIES = ("PIL.Image", "svgwrite", "numpy")
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(duration, " ".join(name for name in {libraries} if name in sys.modules))
+"""
+
+def measure(module, repeat):
+    """Import a module in new interpreters.
+
+    Returns:
+        tupel: The best time in seconds and the drawing libraries imported with the module.
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT.format(module=module, libraries=LIBRARIES)],
+            stdout=subprocess.PIPE, check=True, env=env, universal_newlines=True
+        ).stdout.split(maxsplit=1)
+        duration = float(output[0])
+        best = duration if best is None else min(best, duration)
+    return best, output[1].strip() if len(output) > 1 else ""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5, help="Interpreters started per module, the best counts.")
+    args = parser.parse_args()
+
+    for module in MODULES:
+        duration, libraries = measure(module, args.repeat)
+        print("{:12} {:8.1f}ms  imports: {}".format(module, duration*1000, libraries or "-"))
+
+if __name__ == "__main__":
+    main()
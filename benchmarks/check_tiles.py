@@ -0,0 +1,77 @@
+"""
+Check that the tiled drawing is equal to drawing the tree on a single image.
+
+Draws trees with thin and thick branches with draw_on, tile by tile with
+draw_tile and strip by strip with save_png and counts the differing pixels.
+Exits with 1 if any pixel differs.
+
+    python benchmarks/check_tiles.py --age 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+from math import radians
+
+from PIL import Image, ImageChops
+
+from Tree.core import Tree
+from Tree.tile import draw_tile, get_tiles, save_png
+
+# (branches, thickness) of the checked trees
+CASES = (
+    ([[.5, radians(45)], [.5, radians(-45)]], 1),
+    ([[.5, radians(45)], [.5, radians(-45)]], 5),
+    ([[.6, radians(40)], [.6, radians(-40)]], 12),
+    ([[.5, radians(-30)], [.6, radians(30)], [.4, radians(60)]], 20),
+)
+STEM, LEAF = (255, 0, 255), (255, 255, 255)
+
+def count_differences(first, second):
+    """Count the pixels, which differ between two images of the same size."""
+    red, green, blue = ImageChops.difference(first, second).split()
+    difference = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    return difference.size[0]*difference.size[1] - difference.histogram()[0]
+
+def check(tree, thickness, tile_size, strip_height, **kwargs):
+    """Draw a tree on a single image, in tiles and in strips.
+
+    Returns:
+        tupel: The differing pixels of the tiles and of the strips.
+    """
+    size = tree.get_size()
+    full = Image.new("RGB", size)
+    tree.draw_on(full, STEM, LEAF, thickness, **kwargs)
+
+    tiled = Image.new("RGB", size)
+    for _, _, rectangle in get_tiles(size, tile_size):
+        tiled.paste(draw_tile(tree, rectangle, STEM, LEAF, thickness, **kwargs), rectangle[:2])
+
+    handle, path = tempfile.mkstemp(suffix=".png")
+    os.close(handle)
+    try:
+        save_png(tree, path, size, strip_height, STEM, LEAF, thickness, **kwargs)
+        with Image.open(path) as image:
+            strips = image.convert("RGB")
+    finally:
+        os.remove(path)
+    return count_differences(full, tiled), count_differences(full, strips)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--age", type=int, default=10, help="Age of the checked trees.")
+    args = parser.parse_args()
+
+    failed = False
+    for branches, thickness in CASES:
+        tree = Tree((0, 0, 0, -300), branches)
+        tree.grow(args.age)
+        tree.move_in_rectangle()
+        for name, kwargs in (("full", {}), ("lod", {"min_length": 4, "leaf_fill": True})):
+            tiles, strips = check(tree, thickness, (53, 41), 37, **kwargs)
+            failed = failed or tiles or strips
+            print("thickness {:2} {:4}  tiles: {:5}  strips: {:5}".format(thickness, name, tiles, strips))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,9 @@ REQUIRED = [
     "setuptools",
     "click"
 ]
+EXTRAS = {
+    "numpy": ["numpy"]
+}
 
 setup(
     name=NAME,
@@ -33,10 +36,15 @@ setup(
         "Topic :: Scientific/Engineering :: Mathematics",
     ],
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     license="MIT",
     packages=["Tree"],
     entry_points = {
-        "console_scripts": ["tree-cli=Tree.cli:create_tree"],
+        "console_scripts": [
+            "tree-cli=Tree.cli:create_tree",
+            "tree-batch=Tree.cli:create_trees",
+            "tree-server=Tree.cli:serve_trees"
+        ],
     },
     zip_safe=False,
     include_package_data=True